@@ -0,0 +1,136 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from core import progress
+
+HEAVY = "heavy"
+STANDARD = "standard"
+LIGHT = "light"
+
+# limit: requests running at once; queue: requests allowed to wait for a slot;
+# retry_after: seconds suggested to rejected clients.
+DEFAULT_LIMITS = {
+    HEAVY: {"limit": 2, "queue": 8, "retry_after": 30},
+    STANDARD: {"limit": 8, "queue": 32, "retry_after": 5},
+    LIGHT: {"limit": 32, "queue": 128, "retry_after": 1}
+}
+
+class Overloaded(Exception):
+    def __init__(self, route_class: str, retry_after: int):
+        super().__init__(f"Too many {route_class} requests in progress")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+def parse_limits(spec: str) -> Dict[str, Dict[str, int]]:
+    """
+    Parse overrides such as "heavy=2:8,light=64:256" (limit:queue[:retry_after])
+    on top of DEFAULT_LIMITS.
+    """
+    limits = {name: dict(values) for name, values in DEFAULT_LIMITS.items()}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, values = part.partition("=")
+        fields = [int(value) for value in values.split(":")]
+        entry = limits.setdefault(name.strip(), {"limit": 1, "queue": 0, "retry_after": 5})
+        for key, value in zip(("limit", "queue", "retry_after"), fields):
+            entry[key] = value
+    return limits
+
+class _RouteClass:
+    def __init__(self, limit: int, queue: int, retry_after: int):
+        self.limit = limit
+        self.queue = queue
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+
+class AdmissionController:
+    """Bounds how many requests of each route class run at once and how many may queue."""
+
+    def __init__(self, limits: Dict[str, Dict[str, int]] = None):
+        self._classes = {
+            name: _RouteClass(values["limit"], values["queue"], values["retry_after"])
+            for name, values in (limits or DEFAULT_LIMITS).items()
+        }
+
+    def has_capacity(self, route_class: str) -> bool:
+        state = self._classes.get(route_class)
+        if state is None:
+            return True
+        with state.condition:
+            return state.active < state.limit or state.waiting < state.queue
+
+    def retry_after(self, route_class: str) -> int:
+        state = self._classes.get(route_class)
+        return state.retry_after if state is not None else 0
+
+    @contextmanager
+    def admit(self, route_class: str, wait: bool = False):
+        """
+        Hold a slot of the given class for the duration of the block.
+
+        When every slot is busy the caller waits in the class queue; if the
+        queue is full too, Overloaded is raised unless `wait` is set, in which
+        case the caller first waits for room in the queue. Such callers come
+        from bounded pools (jobs, batch items), and the queue never holds more
+        than its limit.
+        """
+        state = self._classes.get(route_class)
+        if state is None:
+            yield
+            return
+        with state.condition:
+            if state.active >= state.limit:
+                if state.waiting >= state.queue and not wait:
+                    state.rejected += 1
+                    raise Overloaded(route_class, state.retry_after)
+                # A cancelled caller wakes the queue so that it can leave it.
+                unregister = progress.on_cancel(lambda: self._wake(state))
+                try:
+                    while state.active >= state.limit and state.waiting >= state.queue:
+                        progress.check_cancelled()
+                        state.condition.wait()
+                    if state.active >= state.limit:
+                        state.waiting += 1
+                        try:
+                            while state.active >= state.limit:
+                                progress.check_cancelled()
+                                state.condition.wait()
+                        finally:
+                            state.waiting -= 1
+                    progress.check_cancelled()
+                except progress.Cancelled:
+                    # Pass on wake-ups this caller may have consumed.
+                    state.condition.notify_all()
+                    raise
+                finally:
+                    unregister()
+            state.active += 1
+        try:
+            yield
+        finally:
+            with state.condition:
+                state.active -= 1
+                # Callers waiting for a slot and callers waiting for room in the queue share the condition.
+                state.condition.notify_all()
+
+    def _wake(self, state: _RouteClass):
+        with state.condition:
+            state.condition.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {}
+        for name, state in self._classes.items():
+            with state.condition:
+                stats[name] = {
+                    "limit": state.limit,
+                    "queue": state.queue,
+                    "active": state.active,
+                    "waiting": state.waiting,
+                    "rejected": state.rejected
+                }
+        return stats
@@ -0,0 +1,142 @@
+import logging
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from core import progress
+from routes import get_route
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ITEMS = 1000
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 2
+# Each item in flight holds a thread, so clients cannot ask for more than this.
+MAX_CONCURRENCY = 64
+
+# Body parameters that carry the scan target, in the order they are tried.
+TARGET_PARAMS = ("target", "domain", "url", "query")
+
+class BatchError(ValueError):
+    pass
+
+def target_param(route_path: str) -> Optional[str]:
+    handler = get_route(route_path)
+    if handler is None:
+        return None
+    for name in TARGET_PARAMS:
+        if name in handler.params:
+            return name
+    return None
+
+def expand_items(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turn a batch request into a list of {id, route, params} items.
+
+    The body either lists the items explicitly or gives `targets` and
+    `checks`, in which case every check runs against every target.
+    """
+    if "items" in body:
+        items = []
+        for index, item in enumerate(_list_param(body, "items")):
+            if not isinstance(item, dict) or not isinstance(item.get("route"), str):
+                raise BatchError(f"Item {index} must be an object with a route")
+            items.append({
+                "id": str(item.get("id", index)),
+                "route": item["route"],
+                "params": _params(item, f"Item {index} params")
+            })
+    elif "targets" in body and "checks" in body:
+        common = _params(body, "params")
+        checks = _list_param(body, "checks")
+        targets = _list_param(body, "targets")
+        if not all(isinstance(check, str) for check in checks):
+            raise BatchError("checks must be a list of route paths")
+        items = []
+        for check in checks:
+            name = target_param(check)
+            for target in targets:
+                params = dict(common)
+                if name:
+                    params[name] = target
+                items.append({"id": f"{check}:{target}", "route": check, "params": params})
+    else:
+        raise BatchError("Batch body needs either 'items' or 'targets' and 'checks'")
+
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BatchError(f"Batch has {len(items)} items, the limit is {MAX_BATCH_ITEMS}")
+    if len({item["id"] for item in items}) != len(items):
+        raise BatchError("Batch item ids must be unique")
+    return items
+
+def _list_param(body: Dict[str, Any], name: str) -> List[Any]:
+    value = body[name]
+    if not isinstance(value, list):
+        raise BatchError(f"{name} must be a list")
+    return value
+
+def _params(body: Dict[str, Any], label: str) -> Dict[str, Any]:
+    value = body.get("params") or {}
+    if not isinstance(value, dict):
+        raise BatchError(f"{label} must be an object")
+    return value
+
+def batch_limits(body: Dict[str, Any]) -> Tuple[int, int]:
+    """Read `concurrency` (capped at MAX_CONCURRENCY) and `per_host` from a batch request."""
+    limits = []
+    for name, default in (("concurrency", DEFAULT_CONCURRENCY), ("per_host", DEFAULT_PER_HOST)):
+        value = body.get(name)
+        try:
+            value = default if value is None else int(value)
+        except (TypeError, ValueError):
+            raise BatchError(f"{name} must be an integer")
+        if value < 1:
+            raise BatchError(f"{name} must be at least 1")
+        limits.append(value)
+    return min(limits[0], MAX_CONCURRENCY), limits[1]
+
+def item_host(item: Dict[str, Any]) -> str:
+    for name in TARGET_PARAMS:
+        value = item["params"].get(name)
+        if isinstance(value, str) and value:
+            if "://" in value:
+                return (urlparse(value).hostname or value).lower()
+            return value.strip().lower()
+    return ""
+
+def run_batch(items: List[Dict[str, Any]], execute: Callable[[str, Dict[str, Any]], Any],
+              on_result: Callable[[str, Dict[str, Any]], None], concurrency: int = DEFAULT_CONCURRENCY,
+              per_host: int = DEFAULT_PER_HOST):
+    """Run items concurrently, never more than `per_host` at once against the same host."""
+    pending = deque(items)
+    running = {}
+    active_hosts = Counter()
+
+    def call(item):
+        if get_route(item["route"]) is None:
+            return {"route": item["route"], "status": "error", "error": f"Unknown route: {item['route']}"}
+        try:
+            return {"route": item["route"], "status": "ok", "result": execute(item["route"], item["params"])}
+        except Exception as e:
+            logger.error(f"Batch item {item['id']} failed: {e}")
+            return {"route": item["route"], "status": "error", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-worker') as executor:
+        while pending or running:
+            deferred = deque()
+            while pending and len(running) < concurrency:
+                item = pending.popleft()
+                host = item_host(item)
+                if host and active_hosts[host] >= per_host:
+                    deferred.append(item)
+                    continue
+                active_hosts[host] += 1
+                running[progress.submit(executor, call, item)] = (item, host)
+            pending.extendleft(reversed(deferred))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, host = running.pop(future)
+                active_hosts[host] -= 1
+                on_result(item["id"], future.result())
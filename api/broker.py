@@ -0,0 +1,292 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import secrets
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from core import progress
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER_PORT = 3002
+# Workers send a ping at this interval; one that stays silent for HEARTBEAT_TIMEOUT is treated as dead.
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = 30
+# A run whose workers keep dying is failed after this many attempts.
+MAX_ATTEMPTS = 3
+# Queued runs fail once no worker has been connected for this many seconds.
+NO_WORKER_TIMEOUT = 30
+
+class WorkerLost(RuntimeError):
+    pass
+
+class NoWorkers(RuntimeError):
+    pass
+
+def parse_address(address: str, default_port: int = DEFAULT_BROKER_PORT) -> Tuple[str, int]:
+    """Parse "host:port"; the host defaults to 127.0.0.1 and the port to DEFAULT_BROKER_PORT."""
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        return address or "127.0.0.1", default_port
+    return host or "127.0.0.1", int(port)
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def sign_challenge(secret: Optional[str], nonce: str) -> str:
+    """The proof a worker sends for a challenge; the secret itself never crosses the network."""
+    return hmac.new((secret or "").encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+def drop(sock: socket.socket):
+    # shutdown() wakes a thread blocked reading the socket, which close() alone does not.
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+def send_message(sock: socket.socket, lock: threading.Lock, message: Dict[str, Any]):
+    data = (json.dumps(message, default=str) + "\n").encode()
+    with lock:
+        sock.sendall(data)
+
+class _Task:
+    """One route call waiting for, or running on, a remote worker."""
+
+    def __init__(self, route: str, params: Dict[str, Any], listener, resumed: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.params = params
+        self.listener = listener
+        # Stages finished by earlier attempts are skipped when the task is re-queued.
+        self.stages = dict(resumed)
+        self.attempts = 0
+        self.worker = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+class _Worker:
+    def __init__(self, sock: socket.socket, name: str, slots: int):
+        self.sock = sock
+        self.name = name
+        self.slots = slots
+        self.tasks = {}
+        self.write_lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]):
+        send_message(self.sock, self.write_lock, message)
+
+class Broker:
+    """
+    Hands route calls to worker processes (see worker.py) connected over TCP.
+
+    Messages are JSON lines. The broker opens with a random challenge, and a
+    worker introduces itself with its number of slots and the challenge
+    signed with the shared secret. It then receives "run" messages and answers with "stage" reports and
+    a final "done" or "failed". When a worker disconnects or misses its
+    heartbeats, its tasks go back to the front of the queue. Workers run
+    whatever they are sent, so the broker only listens beyond the loopback
+    interface when a secret is set.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_BROKER_PORT, secret: Optional[str] = None):
+        if not secret and not is_loopback(host):
+            raise ValueError(f"The broker needs a secret to listen on {host}, which is not a loopback address")
+        self.secret = secret
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()[:2]
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._workers = []
+        self._idle_since = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+        self._closed = False
+        threading.Thread(target=self._accept_loop, name="broker-accept", daemon=True).start()
+
+    def run(self, route: str, params: Dict[str, Any]) -> Any:
+        """
+        Run a route on a worker and block until its result arrives. Raises
+        NoWorkers right away when no worker is connected, and for a queued run
+        once the workers have been gone for NO_WORKER_TIMEOUT seconds.
+        """
+        task = _Task(route, params, progress.current_listener(), progress.resumed_stages())
+        with self._lock:
+            if not self._workers:
+                raise NoWorkers("No scan workers are connected to the broker")
+            self._queue.append(task)
+        unregister = progress.on_cancel(lambda: self._cancel(task))
+        try:
+            self._dispatch()
+            while not task.done.wait(HEARTBEAT_INTERVAL):
+                with self._lock:
+                    if (self._workers or time.monotonic() - self._idle_since < NO_WORKER_TIMEOUT
+                            or task not in self._queue):
+                        continue
+                    self._queue.remove(task)
+                raise NoWorkers(f"No scan workers have been connected for {NO_WORKER_TIMEOUT} seconds")
+        finally:
+            unregister()
+        progress.check_cancelled()
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": [{"name": worker.name, "slots": worker.slots, "running": len(worker.tasks)}
+                            for worker in self._workers],
+                "queued": len(self._queue),
+                "completed": self.completed,
+                "failed": self.failed,
+                "requeued": self.requeued
+            }
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            drop(worker.sock)
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                sock, address = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_worker, args=(sock, address), name=f"broker-{address[0]}",
+                             daemon=True).start()
+
+    def _serve_worker(self, sock: socket.socket, address):
+        sock.settimeout(HEARTBEAT_TIMEOUT)
+        reader = sock.makefile("rb")
+        worker = None
+        nonce = secrets.token_hex(16)
+        try:
+            sock.sendall((json.dumps({"type": "challenge", "nonce": nonce}) + "\n").encode())
+            hello = json.loads(reader.readline() or b"null")
+            if not isinstance(hello, dict) or hello.get("type") != "hello":
+                return
+            proof = str(hello.get("proof", "")).encode()
+            if self.secret and not hmac.compare_digest(proof, sign_challenge(self.secret, nonce).encode()):
+                logger.warning(f"Rejected worker from {address[0]}: bad secret")
+                return
+            worker = _Worker(sock, hello.get("name") or f"{address[0]}:{address[1]}", max(1, int(hello.get("slots", 1))))
+            with self._lock:
+                self._workers.append(worker)
+            logger.info(f"Worker {worker.name} connected with {worker.slots} slots")
+            self._dispatch()
+            for line in reader:
+                self._handle(worker, json.loads(line))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Lost worker {worker.name if worker else address[0]}: {e}")
+        finally:
+            reader.close()
+            sock.close()
+            if worker is not None:
+                self._remove_worker(worker)
+
+    def _handle(self, worker: _Worker, message: Dict[str, Any]):
+        kind = message.get("type")
+        if kind == "ping":
+            return
+        with self._lock:
+            task = worker.tasks.get(message.get("id"))
+            if task is None:
+                return
+            if kind != "stage":
+                del worker.tasks[task.id]
+        if kind == "stage":
+            task.stages[message["name"]] = message.get("result")
+            if task.listener is not None:
+                try:
+                    task.listener.on_stage(message["name"], message.get("result"), message.get("completed"),
+                                           message.get("total"))
+                except Exception as e:
+                    # A listener failing (e.g. a closed stream) must not cost the connection to the worker.
+                    logger.error(f"Stage listener for task {task.id} failed: {e}")
+            return
+        if kind == "cancelled":
+            pass
+        elif kind == "done":
+            task.result = message.get("result")
+            with self._lock:
+                self.completed += 1
+        else:
+            task.error = RuntimeError(message.get("error") or "Worker failed")
+            with self._lock:
+                self.failed += 1
+        task.done.set()
+        self._dispatch()
+
+    def _remove_worker(self, worker: _Worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+                if not self._workers:
+                    self._idle_since = time.monotonic()
+            orphans = [task for task in worker.tasks.values() if not task.cancelled]
+            worker.tasks.clear()
+            for task in reversed(orphans):
+                if task.attempts >= MAX_ATTEMPTS:
+                    task.error = WorkerLost(f"{task.route} lost {task.attempts} workers")
+                    task.done.set()
+                else:
+                    self._queue.appendleft(task)
+                    self.requeued += 1
+        if orphans:
+            logger.warning(f"Re-queued {len(orphans)} tasks from worker {worker.name}")
+        self._dispatch()
+
+    def _cancel(self, task: _Task):
+        with self._lock:
+            task.cancelled = True
+            worker = task.worker if task.worker is not None and task.id in task.worker.tasks else None
+            if task in self._queue:
+                self._queue.remove(task)
+        if worker is not None:
+            try:
+                worker.send({"type": "cancel", "id": task.id})
+            except OSError:
+                pass
+        task.done.set()
+
+    def _dispatch(self):
+        """Assign queued tasks to workers with free slots."""
+        assignments = []
+        with self._lock:
+            while self._queue:
+                free = [worker for worker in self._workers if len(worker.tasks) < worker.slots]
+                if not free:
+                    break
+                worker = min(free, key=lambda worker: len(worker.tasks) / worker.slots)
+                task = self._queue.popleft()
+                task.worker = worker
+                task.attempts += 1
+                worker.tasks[task.id] = task
+                assignments.append((worker, task))
+        for worker, task in assignments:
+            try:
+                worker.send({"type": "run", "id": task.id, "route": task.route, "params": task.params,
+                             "resumed": task.stages})
+            except OSError:
+                # The worker's reader notices the broken connection and re-queues the task.
+                drop(worker.sock)
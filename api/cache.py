@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 256 * 1024 * 1024
+# Seconds between sweeps of expired entries out of the disk tier.
+SWEEP_INTERVAL = 60
+
+# Parameters that name a host; they are compared case-insensitively.
+HOST_PARAMS = ("target", "domain")
+
+_MISSING = object()
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if name in HOST_PARAMS:
+                value = value.lower().rstrip(".")
+        normalized[name] = value
+    return normalized
+
+def cache_key(path: str, params: Dict[str, Any]) -> str:
+    path = path.rstrip("/") or "/"
+    encoded = json.dumps(normalize_params(params), sort_keys=True, default=str)
+    return hashlib.sha256(f"{path}\n{encoded}".encode()).hexdigest()
+
+def parse_cache_control(header: Optional[str]) -> Tuple[bool, bool]:
+    """Return (read, write): whether a request may be answered from, and stored in, the cache."""
+    directives = {part.strip().lower() for part in (header or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives or "max-age=0" in directives:
+        return False, True
+    return True, True
+
+def is_cacheable(value: Any) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, dict) and "error" in value:
+        return False
+    return True
+
+class DiskBackend:
+    """
+    Stores cache entries as one JSON file per key within a budget of
+    `max_bytes`. Expired entries are swept out every SWEEP_INTERVAL seconds,
+    and the least recently used ones are deleted when a write exceeds the
+    budget. Entries left by an earlier run count against the budget from the
+    start; their expiry is learned when they are first read. Files are only
+    renamed into place or deleted while holding the lock, so the index always
+    matches what is on disk.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_DISK_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> (size, expires) in least recently used order; expires is None until known.
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = time.time() + SWEEP_INTERVAL
+        self.evictions = 0
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json.tmp"):
+                # Left by a write that was interrupted.
+                self._unlink(entry.path)
+            elif entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(found):
+                self._index[key] = (size, None)
+                self._bytes += size
+            for key in self._evict():
+                self._unlink(self._path(key))
+
+    def get(self, key: str) -> Any:
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+        if entry["expires"] < time.time():
+            with self._lock:
+                # A concurrent set may already have replaced the expired file.
+                known = self._index.get(key)
+                if known is None or known[1] is None or known[1] <= entry["expires"]:
+                    self._forget(key)
+                    self._unlink(self._path(key))
+            return _MISSING
+        with self._lock:
+            if key in self._index:
+                self._index[key] = (self._index[key][0], entry["expires"])
+                self._index.move_to_end(key)
+        return entry["value"], entry["expires"]
+
+    def set(self, key: str, value: Any, expires: float):
+        try:
+            data = json.dumps({"expires": expires, "value": value}, default=str)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            return
+        if len(data) > self.max_bytes:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{key}.", suffix=".json.tmp", dir=self.directory)
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            return
+        with self._lock:
+            try:
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key}: {e}")
+                self._unlink(tmp_path)
+                return
+            self._forget(key)
+            self._index[key] = (len(data), expires)
+            self._bytes += len(data)
+            for victim in self._sweep() + self._evict():
+                self._unlink(self._path(victim))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._forget(key)
+            self._unlink(self._path(key))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions
+            }
+
+    def _forget(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+
+    def _sweep(self) -> List[str]:
+        now = time.time()
+        if now < self._next_sweep:
+            return []
+        self._next_sweep = now + SWEEP_INTERVAL
+        expired = [key for key, (_, expires) in self._index.items() if expires is not None and expires < now]
+        for key in expired:
+            self._forget(key)
+        return expired
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self._bytes > self.max_bytes:
+            key = next(iter(self._index))
+            self._forget(key)
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class ResultCache:
+    """In-memory LRU cache of route results with per-entry expiry and an optional disk tier."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, directory: Optional[str] = None,
+                 disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk = DiskBackend(directory, disk_max_bytes) if directory else None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or raise KeyError on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+        if self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not _MISSING:
+                value, expires = stored
+                self._store(key, value, expires)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        raise KeyError(key)
+
+    def set(self, key: str, value: Any, ttl: float):
+        expires = time.time() + ttl
+        self._store(key, value, expires)
+        if self.disk is not None:
+            self.disk.set(key, value, expires)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk": self.disk.stats() if self.disk else None
+            }
+
+    def _store(self, key: str, value: Any, expires: float):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -1,2 +1,10 @@
-from . import vulnerability, network, encryption, reconnaissance
+import importlib
 
+# Submodules are imported on first attribute access; several of them pull in
+# heavy third-party dependencies that not every deployment needs.
+__all__ = ["vulnerability", "network", "encryption", "reconnaissance"]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,6 +4,7 @@ import hashlib
 import secrets
 import string
 import zlib
+import time
 import binascii
 from typing import Tuple, List, Optional
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -108,12 +109,12 @@ class AdvancedCryptography:
 
     def generate_totp(self, secret: bytes, time_step: int = 30) -> str:
         totp_instance = totp.TOTP(secret, 6, hashes.SHA1(), time_step)
-        return totp_instance.generate().decode()
+        return totp_instance.generate(time.time()).decode()
 
     def verify_totp(self, secret: bytes, token: str, time_step: int = 30) -> bool:
         totp_instance = totp.TOTP(secret, 6, hashes.SHA1(), time_step)
         try:
-            totp_instance.verify(token.encode())
+            totp_instance.verify(token.encode(), time.time())
             return True
         except InvalidSignature:
             return False
@@ -536,3 +537,73 @@ class AdvancedCryptography:
 
     def secure_random_string(self, n: int) -> str:
         return base64.b64encode(self.secure_random_bytes(n)).decode('utf-8')
+
+
+# Module-level entry points used by the API routes. Keys, signatures and other
+# binary values cross the API as PEM or base64 strings, so every result is JSON
+# serialisable and can be returned from a worker process.
+
+_crypto = AdvancedCryptography()
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text)
+
+def _key_pair(private_key) -> dict:
+    return {
+        "private_key": private_key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()).decode(),
+        "public_key": private_key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+    }
+
+def generate_key_pair_ecdsa() -> dict:
+    private_key, _ = _crypto.generate_key_pair_ecdsa()
+    return _key_pair(private_key)
+
+def sign_ecdsa(private_key: str, message: str) -> dict:
+    key = load_pem_private_key(private_key.encode(), password=None, backend=_crypto.backend)
+    return {"signature": _b64(_crypto.sign_ecdsa(key, message.encode()))}
+
+def verify_ecdsa(public_key: str, message: str, signature: str) -> dict:
+    key = load_pem_public_key(public_key.encode(), backend=_crypto.backend)
+    return {"valid": _crypto.verify_ecdsa(key, message.encode(), _unb64(signature))}
+
+def generate_key_pair_ecdh() -> dict:
+    private_key, _ = _crypto.generate_key_pair_ecdh()
+    return _key_pair(private_key)
+
+def generate_key_pair_rsa(key_size: int = None) -> dict:
+    private_key, _ = _crypto.generate_rsa_key_pair(key_size or 4096)
+    return _key_pair(private_key)
+
+def generate_key_pair_dsa(key_size: int = None) -> dict:
+    private_key, _ = _crypto.generate_dsa_key_pair(key_size or 3072)
+    return _key_pair(private_key)
+
+def derive_key(password: str, salt: str = None, iterations: int = None) -> dict:
+    """PBKDF2-SHA3-256 key derivation; a random salt is generated when none is given."""
+    salt_bytes = _unb64(salt) if salt else os.urandom(32)
+    iterations = iterations or 100000
+    return {"key": _b64(_crypto.generate_key(password, salt_bytes, iterations)), "salt": _b64(salt_bytes),
+            "iterations": iterations}
+
+def encrypt_file(file_path: str, key: str) -> dict:
+    _crypto.encrypt_file(file_path, _unb64(key))
+    return {"file_path": file_path + '.encrypted'}
+
+def decrypt_file(file_path: str, key: str) -> dict:
+    _crypto.decrypt_file(file_path, _unb64(key))
+    return {"file_path": file_path[:-10]}
+
+def generate_hmac(key: str, message: str) -> dict:
+    return {"hmac": _b64(_crypto.generate_hmac(key.encode(), message.encode()))}
+
+def verify_hmac(key: str, message: str, hmac: str) -> dict:
+    return {"valid": _crypto.verify_hmac(key.encode(), message.encode(), _unb64(hmac))}
+
+def generate_totp(secret: str) -> dict:
+    return {"token": _crypto.generate_totp(base64.b32decode(secret, casefold=True))}
+
+def verify_totp(secret: str, token: str) -> dict:
+    return {"valid": _crypto.verify_totp(base64.b32decode(secret, casefold=True), token)}
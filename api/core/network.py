@@ -8,7 +8,14 @@ import requests
 from bs4 import BeautifulSoup
 import urllib.parse
 import subprocess
+import shlex
+import ipaddress
+import math
+import os
+import queue
+import random
 import re
+import threading
 import paramiko
 import ftplib
 import smtplib
@@ -19,7 +26,8 @@ import psycopg2
 import pyodbc
 import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Any, Union
+from typing import Dict, Iterator, List, Any, Union
+from . import nmapxml, portscan, progress, telemetry, tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -67,29 +75,93 @@ NMAP_SCAN_TYPES = {
     "SCTP_COOKIE_ECHO_SCAN": "-sZ"
 }
 
+# Sharded nmap scans run this many nmap processes at once by default, and split
+# their targets into SHARDS_PER_WORKER times as many shards for load balancing.
+NMAP_SHARD_WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4
+NMAP_SHARD_RETRIES = 2
+# Shards are not made smaller than this, so small scans are not split into many short nmap runs.
+MIN_SHARD_HOSTS = 16
+
+def _run_nmap(scanner: nmap.PortScanner, hosts: str = "127.0.0.1", ports: str = None, arguments: str = "-sV") -> Dict[str, Any]:
+    """
+    Equivalent of scanner.scan() that runs nmap through telemetry.run_tool, so the
+    process is timed and killed when the scan is cancelled.
+    """
+    args = [scanner._nmap_path, "-oX", "-"] + shlex.split(hosts)
+    if ports is not None:
+        args += ["-p", ports]
+    args += shlex.split(arguments)
+    output = telemetry.run_tool(args, capture_output=True, text=True)
+    warnings = [line + "\n" for line in output.stderr.splitlines() if re.match(r"^Warning: ", line, re.IGNORECASE)]
+    errors = [line + "\n" for line in output.stderr.splitlines() if line and not re.match(r"^Warning: ", line, re.IGNORECASE)]
+    return scanner.analyse_nmap_xml_scan(nmap_xml_output=output.stdout, nmap_err=output.stderr,
+                                         nmap_err_keep_trace=errors, nmap_warn_keep_trace=warnings)
+
+def _stream_nmap(hosts: str = "127.0.0.1", ports: str = None, arguments: str = "-sV") -> Iterator[Dict[str, Any]]:
+    """
+    Run nmap with its XML report on stdout and yield each host (see
+    nmapxml.parse_host) as soon as nmap reports it, rather than parsing the
+    whole report after nmap exits as _run_nmap does. Raises nmap.PortScannerError
+    if nmap fails.
+    """
+    args = [nmap.PortScanner()._nmap_path, "-oX", "-"] + shlex.split(hosts)
+    if ports is not None:
+        args += ["-p", ports]
+    args += shlex.split(arguments)
+    parse_error = None
+    with telemetry.stream_tool(args) as process:
+        try:
+            yield from nmapxml.iter_hosts(process.stdout)
+        except nmapxml.ParseError as e:
+            # Truncated or broken output; nmap's own error explains why.
+            process.kill()
+            parse_error = e
+    stderr = (process.stderr_output or b"").decode(errors="replace")
+    errors = [line for line in stderr.splitlines() if line and not re.match(r"^Warning: ", line, re.IGNORECASE)]
+    if process.returncode or parse_error is not None:
+        raise nmap.PortScannerError("\n".join(errors) or f"Cannot parse nmap output: {parse_error}")
+
+def _port_records(host: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """The records of iter_nmap_results for one host from _stream_nmap."""
+    hostname = host["hostnames"][0]["name"] if host["hostnames"] else ""
+    for port in host["ports"]:
+        yield {
+            "host": host["host"],
+            "port": port["port"],
+            "protocol": port["protocol"],
+            "state": port["state"],
+            "name": port["name"],
+            "product": port["product"],
+            "version": port["version"],
+            "extrainfo": port["extrainfo"],
+            "reason": port["reason"],
+            "hostname": hostname
+        }
+
+def _nmap_options(scan_types: List[str] = None, ports: str = None, arguments: str = None) -> str:
+    if not scan_types:
+        scan_types = ["TCP_SYN_SCAN"]
+
+    scan_options = []
+    for scan_type in scan_types:
+        if scan_type.upper() in NMAP_SCAN_TYPES:
+            scan_options.append(NMAP_SCAN_TYPES[scan_type.upper()])
+        else:
+            logger.warning(f"Invalid scan type: {scan_type}")
+            raise ValueError(f"Invalid scan type: {scan_type}")
+
+    if ports:
+        scan_options.append(f"-p {ports}")
+    if arguments:
+        scan_options.append(arguments)
+    return " ".join(scan_options)
+
 def nmap_scan(target: str, scan_types: List[str] = None, ports: str = None, arguments: str = None) -> Dict[str, Any]:
     try:
-        scanner = nmap.PortScanner()
-        
-        if not scan_types:
-            scan_types = ["TCP_SYN_SCAN"]
-        
-        scan_options = []
-        for scan_type in scan_types:
-            if scan_type.upper() in NMAP_SCAN_TYPES:
-                scan_options.append(NMAP_SCAN_TYPES[scan_type.upper()])
-            else:
-                logger.warning(f"Invalid scan type: {scan_type}")
-                return {"error": f"Invalid scan type: {scan_type}"}
-        
-        if ports:
-            scan_options.append(f"-p {ports}")
-        if arguments:
-            scan_options.append(arguments)
-        
-        logger.info(f"Starting Nmap scan on {target} with options: {' '.join(scan_options)}")
-        scanner.scan(hosts=target, arguments=" ".join(scan_options))
-        return parse_nmap_results(scanner)
+        return list(iter_nmap_scan(target, scan_types, ports, arguments))
+    except ValueError as e:
+        return {"error": str(e)}
     except nmap.PortScannerError as e:
         logger.error(f"Nmap scan error: {e}")
         return {"error": f"Nmap scan error: {e}"}
@@ -97,14 +169,121 @@ def nmap_scan(target: str, scan_types: List[str] = None, ports: str = None, argu
         logger.error(f"Unexpected error during Nmap scan: {e}")
         return {"error": f"Unexpected error during Nmap scan: {e}"}
 
+def iter_nmap_scan(target: str, scan_types: List[str] = None, ports: str = None, arguments: str = None) -> Iterator[Dict[str, Any]]:
+    """
+    Like nmap_scan, but yields one record per port so that large results can be
+    streamed. Each host's records are yielded as soon as nmap reports the host.
+    Errors are raised instead of being returned as a result.
+    """
+    options = _nmap_options(scan_types, ports, arguments)
+    logger.info(f"Starting Nmap scan on {target} with options: {options}")
+    for host in _stream_nmap(target, arguments=options):
+        yield from _port_records(host)
+
+def shard_targets(target: str, shards: int) -> List[str]:
+    """
+    Split a target expression (CIDRs, octet ranges, host lists) into at most
+    `shards` nmap target strings with about the same number of hosts each.
+    Runs of consecutive addresses are written back as CIDR blocks, so a shard
+    of a /16 stays a short command line.
+    """
+    hosts = portscan.parse_targets(target)
+    count = max(1, min(shards, math.ceil(len(hosts) / MIN_SHARD_HOSTS)))
+    size = math.ceil(len(hosts) / count)
+    result = []
+    for start in range(0, len(hosts), size):
+        addresses, names = [], []
+        for host in hosts[start:start + size]:
+            try:
+                addresses.append(ipaddress.ip_address(host))
+            except ValueError:
+                names.append(host)
+        blocks = []
+        for version in (4, 6):
+            blocks += [str(block.network_address) if block.num_addresses == 1 else str(block)
+                       for block in ipaddress.collapse_addresses(
+                           address for address in addresses if address.version == version)]
+        result.append(" ".join(blocks + names))
+    return result
+
+def iter_nmap_scan_sharded(target: str, scan_types: List[str] = None, ports: str = None, arguments: str = None,
+                           workers: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    Like iter_nmap_scan, but splits the targets into shards scanned by up to
+    `workers` nmap processes at once (one per core by default). A shard that
+    fails is retried on its own up to NMAP_SHARD_RETRIES times; if it keeps
+    failing, a {"targets": ..., "error": ...} record takes the place of its hosts.
+    """
+    options = _nmap_options(scan_types, ports, arguments)
+    workers = max(1, workers or NMAP_SHARD_WORKERS)
+    shards = shard_targets(target, workers * SHARDS_PER_WORKER)
+    logger.info(f"Starting sharded Nmap scan on {target} with options: {options} "
+                f"({len(shards)} shards, {workers} processes)")
+    found = queue.Queue()
+    finished = object()
+
+    def scan_shard(shard):
+        reported = set()
+        for attempt in range(NMAP_SHARD_RETRIES + 1):
+            try:
+                for host in _stream_nmap(shard, arguments=options):
+                    # A retried shard reports again the hosts an earlier attempt already yielded.
+                    if host["host"] not in reported:
+                        reported.add(host["host"])
+                        found.put(host)
+                return
+            except Exception as e:
+                if attempt == NMAP_SHARD_RETRIES:
+                    logger.error(f"Nmap shard {shard} failed after {attempt + 1} attempts: {e}")
+                    found.put({"targets": shard, "error": f"Nmap scan error: {e}"})
+                    return
+                logger.warning(f"Nmap shard {shard} failed, retrying: {e}")
+
+    # The shards run under their own token, so that closing this generator early stops their nmap processes.
+    token = progress.CancelToken()
+    unregister = progress.on_cancel(token.cancel)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with progress.cancellable(token):
+            futures = [progress.submit(executor, tracing.traced(f"nmap shard {index}", scan_shard), shard)
+                       for index, shard in enumerate(shards)]
+        for future in futures:
+            future.add_done_callback(lambda future: found.put(finished))
+        remaining = len(futures)
+        while remaining:
+            item = found.get()
+            if item is finished:
+                remaining -= 1
+            elif "error" in item:
+                yield item
+            else:
+                yield from _port_records(item)
+    finally:
+        unregister()
+        token.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+    progress.check_cancelled()
+
+def nmap_scan_sharded(target: str, scan_types: List[str] = None, ports: str = None, arguments: str = None,
+                      workers: int = None) -> Union[List[Dict[str, Any]], Dict[str, str]]:
+    try:
+        return list(iter_nmap_scan_sharded(target, scan_types, ports, arguments, workers))
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Unexpected error during sharded Nmap scan: {e}")
+        return {"error": f"Unexpected error during sharded Nmap scan: {e}"}
+
 def parse_nmap_results(scanner: nmap.PortScanner) -> List[Dict[str, Any]]:
-    parsed_results = []
+    return list(iter_nmap_results(scanner))
+
+def iter_nmap_results(scanner: nmap.PortScanner) -> Iterator[Dict[str, Any]]:
     for host in scanner.all_hosts():
         for proto in scanner[host].all_protocols():
             ports = scanner[host][proto].keys()
             for port in ports:
                 service = scanner[host][proto][port]
-                result = {
+                yield {
                     "host": host,
                     "port": port,
                     "protocol": proto,
@@ -116,82 +295,241 @@ def parse_nmap_results(scanner: nmap.PortScanner) -> List[Dict[str, Any]]:
                     "reason": service["reason"],
                     "hostname": service.get("hostname", "")
                 }
-                parsed_results.append(result)
-    return parsed_results
 
-def ping(target: str, count: int = 4) -> Dict[str, Union[str, int, float]]:
+def _sr(packets, **kwargs):
+    # scapy's sr, counting packets for the scan trace.
+    tracing.count("packets_sent", len(packets))
+    answered, unanswered = sr(packets, **kwargs)
+    tracing.count("packets_received", len(answered))
+    return answered, unanswered
+
+def _resolve(hosts: List[str]):
+    """Map each host to its IPv4 address; hosts that do not resolve get an error result instead."""
+    addresses, errors = {}, {}
+    for host in hosts:
+        try:
+            addresses[host] = socket.gethostbyname(host)
+        except socket.error as e:
+            errors[host] = {"target": host, "error": f"Cannot resolve {host}: {e}"}
+    return addresses, errors
+
+def _rtt_stats(samples: List[float]) -> Dict[str, float]:
+    """RTT min/avg/max in milliseconds of samples in seconds."""
+    if not samples:
+        return {}
+    return {
+        "rtt_min": round(min(samples) * 1000, 3),
+        "rtt_avg": round(sum(samples) / len(samples) * 1000, 3),
+        "rtt_max": round(max(samples) * 1000, 3)
+    }
+
+def _probe_batch(targets: Union[str, List[str]], count: int, timeout: float, build, answers) -> List[Dict[str, Any]]:
     """
-    Perform ICMP ping with customizable count.
+    Send `count` probes to every target in a single sr() batch rather than one
+    sr1() round trip at a time. build(ip, seq) makes the probe with sequence
+    number seq; answers(probe, reply) checks that a reply carries the probe's
+    id and sequence number. Returns per-target counts, loss and RTT min/avg/max in ms.
     """
-    try:
-        success = 0
-        for _ in range(count):
-            icmp_ping = IP(dst=target)/ICMP()
-            resp = sr1(icmp_ping, timeout=2, verbose=False)
-            if resp:
-                success += 1
-        
-        loss_percentage = ((count - success) / count) * 100
-        logger.info(f"Ping results for {target}: {success}/{count} successful, {loss_percentage:.2f}% loss")
-        return {
-            "target": target,
+    hosts = portscan.parse_targets(targets)
+    addresses, results = _resolve(hosts)
+    ips = list(dict.fromkeys(addresses.values()))
+    # Probes are interleaved across targets, so each target's probes are spread over the batch.
+    packets = [build(ip, seq) for seq in range(count) for ip in ips]
+    rtts = {ip: [] for ip in ips}
+    if packets:
+        # sr() pairs each probe with at most one reply.
+        answered, _ = _sr(packets, timeout=timeout, verbose=False)
+        for probe, reply in answered:
+            if reply.haslayer(IP) and reply[IP].src == probe[IP].dst and answers(probe, reply):
+                rtts[probe[IP].dst].append(reply.time - probe.sent_time)
+    for host, ip in addresses.items():
+        samples = rtts[ip]
+        results[host] = {
+            "target": host,
             "sent": count,
-            "received": success,
-            "loss_percentage": loss_percentage
+            "received": len(samples),
+            "loss_percentage": ((count - len(samples)) / count) * 100,
+            **_rtt_stats(samples)
         }
+    return [results[host] for host in hosts]
+
+def _icmp_probe(ident: int):
+    def build(ip, seq):
+        return IP(dst=ip)/ICMP(id=ident, seq=seq)
+
+    def answers(probe, reply):
+        return (reply.haslayer(ICMP) and reply[ICMP].type == 0 and reply[ICMP].id == ident
+                and reply[ICMP].seq == probe[ICMP].seq)
+    return build, answers
+
+def _tcp_probe(port: int, ident: int):
+    # Each probe of a target gets its own source port, which the reply's destination port echoes.
+    base = 1024 + ident % (65536 - 1024 - 4096)
+
+    def build(ip, seq):
+        return IP(dst=ip)/TCP(sport=base + seq % 4096, dport=port, flags="S", seq=ident)
+
+    def answers(probe, reply):
+        return (reply.haslayer(TCP) and reply[TCP].flags & 0x12 and reply[TCP].dport == probe[TCP].sport
+                and reply[TCP].ack == (ident + 1) & 0xFFFFFFFF)
+    return build, answers
+
+def ping_sweep(targets: Union[str, List[str]], count: int = 4, timeout: float = 2) -> List[Dict[str, Any]]:
+    """
+    ICMP ping of several hosts or CIDR ranges at once, with per-target RTT
+    statistics. All probes go out in one batch, so the sweep takes about
+    `timeout` seconds however many targets and probes there are.
+    """
+    try:
+        results = _probe_batch(targets, count or 4, timeout or 2, *_icmp_probe(random.randrange(1, 0x10000)))
+        for result in results:
+            if "error" not in result:
+                logger.info(f"Ping results for {result['target']}: {result['received']}/{result['sent']} successful, "
+                            f"{result['loss_percentage']:.2f}% loss")
+        return results
     except Exception as e:
         logger.error(f"Error during ping: {e}")
-        return {"error": f"Ping failed: {e}"}
+        return [{"error": f"Ping failed: {e}"}]
 
-def tcp_ping(target: str, port: int = 80, count: int = 4) -> Dict[str, Union[str, int, float]]:
+def tcp_ping_sweep(targets: Union[str, List[str]], port: int = 80, count: int = 4,
+                   timeout: float = 2) -> List[Dict[str, Any]]:
     """
-    Perform TCP ping with customizable port and count.
+    TCP SYN ping of several hosts or CIDR ranges at once; like ping_sweep, a
+    SYN/ACK or RST from the port counts as a reply.
     """
     try:
-        success = 0
-        for _ in range(count):
-            tcp_ping = IP(dst=target)/TCP(dport=port, flags="S")
-            resp = sr1(tcp_ping, timeout=2, verbose=False)
-            if resp and resp.haslayer(TCP) and resp.getlayer(TCP).flags & 0x12:
-                success += 1
-        
-        loss_percentage = ((count - success) / count) * 100
-        logger.info(f"TCP ping results for {target}:{port}: {success}/{count} successful, {loss_percentage:.2f}% loss")
-        return {
-            "target": target,
-            "port": port,
-            "sent": count,
-            "received": success,
-            "loss_percentage": loss_percentage
-        }
+        port = port or 80
+        ident = random.randrange(0, 0x100000000)
+        results = _probe_batch(targets, count or 4, timeout or 2, *_tcp_probe(port, ident))
+        for result in results:
+            if "error" not in result:
+                result["port"] = port
+                logger.info(f"TCP ping results for {result['target']}:{port}: {result['received']}/{result['sent']} "
+                            f"successful, {result['loss_percentage']:.2f}% loss")
+        return results
     except Exception as e:
         logger.error(f"Error during TCP ping: {e}")
-        return {"error": f"TCP ping failed: {e}"}
+        return [{"error": f"TCP ping failed: {e}"}]
 
-def traceroute(target: str, max_hops: int = 30, timeout: int = 2) -> List[Dict[str, Union[int, str]]]:
+def ping(target: str, count: int = 4) -> Dict[str, Union[str, int, float]]:
     """
-    Perform traceroute to the target.
+    Perform ICMP ping with customizable count. The probes are sent as one batch;
+    a target that names several hosts gets a list with one result per host.
     """
-    try:
-        results = []
+    results = ping_sweep(target, count)
+    return results[0] if len(results) == 1 else results
+
+def tcp_ping(target: str, port: int = 80, count: int = 4) -> Dict[str, Union[str, int, float]]:
+    """
+    Perform TCP ping with customizable port and count. The probes are sent as one batch.
+    """
+    results = tcp_ping_sweep(target, port, count)
+    return results[0] if len(results) == 1 else results
+
+def _trace_paths(hosts: List[str], max_hops: int, timeout: float) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Trace the route to every host with a single sr() batch holding a probe for
+    each TTL of each host, so a trace costs one timeout instead of one per hop.
+    A path ends at the first hop that is the destination or reports it unreachable.
+    """
+    addresses, paths = _resolve(hosts)
+    ips = list(dict.fromkeys(addresses.values()))
+    ident = random.randrange(1, 0x10000)
+    packets = [IP(dst=ip, ttl=ttl)/ICMP(id=ident, seq=ttl) for ttl in range(1, max_hops + 1) for ip in ips]
+    replies = {ip: {} for ip in ips}
+    if packets:
+        # Time-exceeded replies quote the probe's header, which sr() uses to pair them with their probe.
+        answered, _ = _sr(packets, timeout=timeout, verbose=False)
+        for probe, reply in answered:
+            replies[probe[IP].dst][probe[IP].ttl] = (probe, reply)
+    for host, ip in addresses.items():
+        path = []
         for ttl in range(1, max_hops + 1):
-            pkt = IP(dst=target, ttl=ttl) / ICMP()
-            reply = sr1(pkt, timeout=timeout, verbose=0)
-            if reply is None:
-                results.append({"hop": ttl, "ip": "*"})
-            elif reply.type == 3:
-                results.append({"hop": ttl, "ip": reply.src})
+            if ttl not in replies[ip]:
+                path.append({"hop": ttl, "ip": "*"})
+                continue
+            probe, reply = replies[ip][ttl]
+            path.append({"hop": ttl, "ip": reply.src, "rtt": round((reply.time - probe.sent_time) * 1000, 3)})
+            if reply.src == ip or (reply.haslayer(ICMP) and reply[ICMP].type == 3):
                 break
-            else:
-                results.append({"hop": ttl, "ip": reply.src})
-                if reply.src == target:
-                    break
+        paths[host] = path
+    return paths
+
+def traceroute(target: str, max_hops: int = 30, timeout: int = 2) -> List[Dict[str, Union[int, str]]]:
+    """
+    Perform traceroute to the target. All TTLs are probed at once.
+    """
+    try:
+        results = _trace_paths([target], max_hops, timeout)[target]
+        if isinstance(results, dict):
+            return [results]
         logger.info(f"Traceroute to {target} completed with {len(results)} hops")
         return results
     except Exception as e:
         logger.error(f"Error during traceroute: {e}")
         return [{"error": f"Traceroute failed: {e}"}]
 
+def hop_graph(paths: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Merge traceroute paths into one graph of the routers and targets seen,
+    rooted at "local" (the scanning host). Nodes carry the RTTs measured to
+    them; edges link consecutive answering hops, with `gap` silent hops in
+    between and the RTT added along the link.
+    """
+    nodes = {"local": {"id": "local", "hop": 0, "targets": [], "samples": []}}
+    edges = {}
+    for target, path in paths.items():
+        if isinstance(path, dict):
+            continue
+        previous, previous_hop, previous_rtt = "local", 0, 0.0
+        for hop in path:
+            if hop["ip"] == "*":
+                continue
+            node = nodes.setdefault(hop["ip"], {"id": hop["ip"], "hop": hop["hop"], "targets": [], "samples": []})
+            node["hop"] = min(node["hop"], hop["hop"])
+            node["samples"].append(hop["rtt"] / 1000)
+            if target not in node["targets"]:
+                node["targets"].append(target)
+            if previous != hop["ip"]:
+                edge = edges.setdefault((previous, hop["ip"]), {"source": previous, "target": hop["ip"],
+                                                                "gap": hop["hop"] - previous_hop - 1, "samples": []})
+                edge["gap"] = min(edge["gap"], hop["hop"] - previous_hop - 1)
+                edge["samples"].append(max(0.0, hop["rtt"] - previous_rtt) / 1000)
+            previous, previous_hop, previous_rtt = hop["ip"], hop["hop"], hop["rtt"]
+    for item in list(nodes.values()) + list(edges.values()):
+        item.update(_rtt_stats(item.pop("samples")))
+    return {"nodes": sorted(nodes.values(), key=lambda node: (node["hop"], node["id"])), "edges": list(edges.values())}
+
+def hop_graph_dot(graph: Dict[str, Any]) -> str:
+    """Graphviz DOT source of a hop_graph, e.g. for `dot -Tsvg`."""
+    lines = ["digraph traceroute {", "  rankdir=LR;"]
+    for node in graph["nodes"]:
+        rtt = f"\\n{node['rtt_avg']} ms" if "rtt_avg" in node else ""
+        lines.append(f'  "{node["id"]}" [label="{node["id"]}{rtt}"];')
+    for edge in graph["edges"]:
+        style = ' style=dashed' if edge["gap"] else ''
+        lines.append(f'  "{edge["source"]}" -> "{edge["target"]}" [label="{edge.get("rtt_min", 0)} ms"{style}];')
+    lines.append("}")
+    return "\n".join(lines)
+
+def traceroute_map(targets: Union[str, List[str]], max_hops: int = 30, timeout: float = 2,
+                   format: str = None) -> Dict[str, Any]:
+    """
+    Trace several hosts or CIDR ranges at once and merge their paths into a
+    deduplicated hop graph. With format "dot" the graph is also returned as
+    Graphviz source under "dot".
+    """
+    try:
+        paths = _trace_paths(portscan.parse_targets(targets), max_hops or 30, timeout or 2)
+        result = {"paths": paths, **hop_graph(paths)}
+        if format == "dot":
+            result["dot"] = hop_graph_dot(result)
+        logger.info(f"Traceroute map of {len(paths)} targets completed with {len(result['nodes']) - 1} hops")
+        return result
+    except Exception as e:
+        logger.error(f"Error during traceroute map: {e}")
+        return {"error": f"Traceroute map failed: {e}"}
+
 def dns_query(target: str, record_type: str = 'A', dns_server: str = '8.8.8.8') -> Union[List[str], Dict[str, str]]:
     """
     Perform DNS query with customizable record type and DNS server.
@@ -209,22 +547,13 @@ def dns_query(target: str, record_type: str = 'A', dns_server: str = '8.8.8.8')
 
 def port_scan(target: str, ports: List[int]) -> List[Dict[str, Union[int, str]]]:
     """
-    Perform a basic TCP connect port scan.
+    Perform a TCP connect port scan. Ports are probed concurrently by
+    portscan.ConnectScanner; `target` may also name several hosts or a CIDR range.
     """
-    try:
-        results = []
-        for port in ports:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex((target, port))
-            if result == 0:
-                results.append({"port": port, "state": "open"})
-            sock.close()
+    results = portscan.port_scan(target, ports)
+    if not any("error" in result for result in results):
         logger.info(f"Port scan on {target} completed. {len(results)} open ports found.")
-        return results
-    except socket.error as e:
-        logger.error(f"Socket error during port scan: {e}")
-        return [{"error": f"Port scan failed: {e}"}]
+    return results
 
 def ssl_scan(target: str, port: int = 443) -> Dict[str, Any]:
     """
@@ -283,7 +612,7 @@ def os_fingerprint(target: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
     """
     try:
         nm = nmap.PortScanner()
-        nm.scan(target, arguments="-O")
+        _run_nmap(nm, target, arguments="-O")
         results = nm[target]['osmatch']
         logger.info(f"OS fingerprinting completed for {target}")
         return results
@@ -316,7 +645,7 @@ def udp_flood(target: str, port: int, count: int = 1000) -> Dict[str, Union[str,
 def network_sweep(network: str) -> Union[List[str], Dict[str, str]]:
     try:
         nm = nmap.PortScanner()
-        nm.scan(hosts=network, arguments='-sn')
+        _run_nmap(nm, hosts=network, arguments='-sn')
         live_hosts = [host for host in nm.all_hosts() if nm[host].state() == 'up']
         logger.info(f"Network sweep completed on {network}. {len(live_hosts)} live hosts found.")
         return live_hosts
@@ -327,7 +656,7 @@ def network_sweep(network: str) -> Union[List[str], Dict[str, str]]:
 def service_enumeration(target: str, ports: List[int]) -> Union[Dict[int, Dict[str, Any]], Dict[str, str]]:
     try:
         nm = nmap.PortScanner()
-        nm.scan(target, arguments=f'-sV -p{",".join(map(str, ports))}')
+        _run_nmap(nm, target, arguments=f'-sV -p{",".join(map(str, ports))}')
         services = nm[target]['tcp']
         results = {port: services[port] for port in services if services[port]['state'] == 'open'}
         logger.info(f"Service enumeration completed for {target} on ports {ports}")
@@ -336,120 +665,137 @@ def service_enumeration(target: str, ports: List[int]) -> Union[Dict[int, Dict[s
         logger.error(f"Nmap error during service enumeration: {e}")
         return {"error": f"Service enumeration failed: {e}"}
 
+# NSE enumerations that enumerate_services can batch into one nmap run:
+# name -> (scripts, protocol, default port, result shape, label). "port" results are the
+# script outputs of the bound port, "host" results the host script entries, and "ports"
+# results the host script entries followed by each port's outputs tagged with the port.
+NSE_ENUMERATIONS = {
+    "vulnerability_scan": (["vuln"], "tcp", None, "ports", "Vulnerability scan"),
+    "http_enum": (["http-enum"], "tcp", None, "ports", "HTTP enumeration"),
+    "ssl_enum": (["ssl-enum-ciphers"], "tcp", 443, "port", "SSL enumeration"),
+    "dns_brute": (["dns-brute"], "tcp", None, "host", "DNS brute-force"),
+    "smb_enum": (["smb-enum-shares", "smb-enum-users"], "tcp", None, "host", "SMB enumeration"),
+    "mysql_enum": (["mysql-enum"], "tcp", 3306, "port", "MySQL enumeration"),
+    "ftp_anon": (["ftp-anon"], "tcp", 21, "port", "FTP anonymous check"),
+    "snmp_brute": (["snmp-brute"], "udp", 161, "port", "SNMP brute-force"),
+    "ssh_auth_methods": (["ssh-auth-methods"], "tcp", 22, "port", "SSH authentication methods enumeration"),
+    "telnet_brute": (["telnet-brute"], "tcp", 23, "port", "Telnet brute-force")
+}
+# Script names that select a category of NSE scripts rather than one script.
+NSE_CATEGORIES = {"auth", "broadcast", "brute", "default", "discovery", "dos", "exploit", "external", "fuzzer",
+                  "intrusive", "malware", "safe", "version", "vuln"}
+
+def _nse_result(host: Dict[str, Any], enumeration: str, ports: List[int], claimed: set) -> Any:
+    """Cut one enumeration's result out of a host's output (see nmapxml.parse_host)."""
+    scripts, protocol, _, shape, _ = NSE_ENUMERATIONS[enumeration]
+    categories = NSE_CATEGORIES.intersection(scripts)
+
+    def ours(script_id):
+        # A category claims whatever the named scripts of the batch did not produce.
+        return script_id in scripts or (categories and script_id not in claimed)
+
+    bound = [port for port in host["ports"]
+             if port["protocol"] == protocol and (ports is None or port["port"] in ports)]
+    if shape == "port":
+        return {script_id: output for port in bound for script_id, output in port["script"].items() if ours(script_id)}
+    results = [entry for entry in host["hostscript"] if ours(entry["id"])]
+    if shape == "ports":
+        results += [{"id": script_id, "output": output, "port": port["port"]}
+                    for port in bound for script_id, output in port["script"].items() if ours(script_id)]
+    return results
+
+def enumerate_services(target: str, bindings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run several NSE enumerations against one target in a single nmap process
+    and split its output into the result each enumeration's function returns.
+
+    `bindings` maps a name in NSE_ENUMERATIONS to its port (or ports, for
+    http_enum and smb_enum), or to None for its default. To run one
+    enumeration on several single ports, give each run its own name bound to
+    (enumeration, port), e.g. {"ssh_auth_methods:2222": ("ssh_auth_methods", 2222)}.
+
+    nmap cannot tie a script to a port, so a script also runs on the other
+    enumerations' ports and those outputs are dropped. Enumerations without
+    any port run on nmap's default ports in a second process, as one nmap run
+    cannot combine a port list with its defaults.
+    """
+    runs = {}
+    for name, binding in bindings.items():
+        enumeration, ports = binding if isinstance(binding, tuple) else (name, binding)
+        default = NSE_ENUMERATIONS[enumeration][2]
+        ports = ports if ports is not None else default
+        runs[name] = (enumeration, None if ports is None else portscan.parse_ports(ports))
+
+    results = {}
+    for names in ([name for name, run in runs.items() if run[1] is not None],
+                  [name for name, run in runs.items() if run[1] is None]):
+        if not names:
+            continue
+        scripts = []
+        for name in names:
+            scripts += [script for script in NSE_ENUMERATIONS[runs[name][0]][0] if script not in scripts]
+        claimed = set(scripts) - NSE_CATEGORIES
+        bound = sorted({(NSE_ENUMERATIONS[runs[name][0]][1], port) for name in names for port in runs[name][1] or ()})
+        spec = ",".join(f"{'U' if protocol == 'udp' else 'T'}:{port}" for protocol, port in bound) or None
+        options = f"--script {','.join(scripts)}"
+        if any(protocol == "udp" for protocol, _ in bound):
+            options = ("-sU -sS " if any(protocol == "tcp" for protocol, _ in bound) else "-sU ") + options
+        try:
+            hosts = list(_stream_nmap(target, ports=spec, arguments=options))
+        except nmap.PortScannerError as e:
+            for name in names:
+                label = NSE_ENUMERATIONS[runs[name][0]][4]
+                logger.error(f"Nmap error during {label}: {e}")
+                results[name] = {"error": f"{label} failed: {e}"}
+            continue
+        for name in names:
+            enumeration, ports = runs[name]
+            label = NSE_ENUMERATIONS[enumeration][4]
+            if not hosts:
+                results[name] = {"error": f"{label} failed: {target} did not respond"}
+                continue
+            results[name] = _nse_result(hosts[0], enumeration, ports, claimed)
+            logger.info(f"{label} completed for {target}" + (f":{','.join(map(str, ports))}" if ports else ""))
+    return results
+
 def vulnerability_scan(target: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments="--script vuln")
-        results = nm[target].get('hostscript', [])
-        logger.info(f"Vulnerability scan completed for {target}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during vulnerability scan: {e}")
-        return {"error": f"Vulnerability scan failed: {e}"}
+    return enumerate_services(target, {"vulnerability_scan": None})["vulnerability_scan"]
 
-def http_enum(target: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments="--script http-enum")
-        results = nm[target].get('hostscript', [])
-        logger.info(f"HTTP enumeration completed for {target}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during HTTP enumeration: {e}")
-        return {"error": f"HTTP enumeration failed: {e}"}
+def http_enum(target: str, ports: str = None) -> Union[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Run http-enum against the given ports (nmap's default ports when unset).
+    The script reports per port; its findings are listed with their port.
+    """
+    return enumerate_services(target, {"http_enum": ports})["http_enum"]
 
 def ssl_enum(target: str, port: int = 443) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script ssl-enum-ciphers -p {port}")
-        results = nm[target]['tcp'][port].get('script', {})
-        logger.info(f"SSL enumeration completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during SSL enumeration: {e}")
-        return {"error": f"SSL enumeration failed: {e}"}
+    return enumerate_services(target, {"ssl_enum": port})["ssl_enum"]
 
 def dns_brute(domain: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(domain, arguments="--script dns-brute")
-        results = nm[domain].get('hostscript', [])
-        logger.info(f"DNS brute-force completed for {domain}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during DNS brute-force: {e}")
-        return {"error": f"DNS brute-force failed: {e}"}
+    return enumerate_services(domain, {"dns_brute": None})["dns_brute"]
 
-def smb_enum(target: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments="--script smb-enum-shares,smb-enum-users")
-        results = nm[target].get('hostscript', [])
-        logger.info(f"SMB enumeration completed for {target}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during SMB enumeration: {e}")
-        return {"error": f"SMB enumeration failed: {e}"}
+def smb_enum(target: str, ports: str = None) -> Union[List[Dict[str, Any]], Dict[str, str]]:
+    return enumerate_services(target, {"smb_enum": ports})["smb_enum"]
 
 def mysql_enum(target: str, port: int = 3306) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script mysql-enum -p {port}")
-        results = nm[target]['tcp'][port].get('script', {})
-        logger.info(f"MySQL enumeration completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during MySQL enumeration: {e}")
-        return {"error": f"MySQL enumeration failed: {e}"}
+    return enumerate_services(target, {"mysql_enum": port})["mysql_enum"]
 
 def ftp_anon(target: str, port: int = 21) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script ftp-anon -p {port}")
-        results = nm[target]['tcp'][port].get('script', {})
-        logger.info(f"FTP anonymous check completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during FTP anonymous check: {e}")
-        return {"error": f"FTP anonymous check failed: {e}"}
+    return enumerate_services(target, {"ftp_anon": port})["ftp_anon"]
 
 def snmp_brute(target: str, port: int = 161) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script snmp-brute -p {port}")
-        results = nm[target]['udp'][port].get('script', {})
-        logger.info(f"SNMP brute-force completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during SNMP brute-force: {e}")
-        return {"error": f"SNMP brute-force failed: {e}"}
+    return enumerate_services(target, {"snmp_brute": port})["snmp_brute"]
 
 def ssh_auth_methods(target: str, port: int = 22) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script ssh-auth-methods -p {port}")
-        results = nm[target]['tcp'][port].get('script', {})
-        logger.info(f"SSH authentication methods enumeration completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during SSH authentication methods enumeration: {e}")
-        return {"error": f"SSH authentication methods enumeration failed: {e}"}
+    return enumerate_services(target, {"ssh_auth_methods": port})["ssh_auth_methods"]
 
 def telnet_brute(target: str, port: int = 23) -> Union[Dict[str, Any], Dict[str, str]]:
-    try:
-        nm = nmap.PortScanner()
-        nm.scan(target, arguments=f"--script telnet-brute -p {port}")
-        results = nm[target]['tcp'][port].get('script', {})
-        logger.info(f"Telnet brute-force completed for {target}:{port}")
-        return results
-    except nmap.PortScannerError as e:
-        logger.error(f"Nmap error during Telnet brute-force: {e}")
-        return {"error": f"Telnet brute-force failed: {e}"}
+    return enumerate_services(target, {"telnet_brute": port})["telnet_brute"]
 
 def dhcp_discover(interface: str) -> Union[Dict[str, Any], Dict[str, str]]:
     try:
         nm = nmap.PortScanner()
-        nm.scan(arguments=f"--script broadcast-dhcp-discover -e {interface}")
+        _run_nmap(nm, arguments=f"--script broadcast-dhcp-discover -e {interface}")
         results = nm.scaninfo()
         logger.info(f"DHCP discovery completed on interface {interface}")
         return results
@@ -457,45 +803,91 @@ def dhcp_discover(interface: str) -> Union[Dict[str, Any], Dict[str, str]]:
         logger.error(f"Nmap error during DHCP discovery: {e}")
         return {"error": f"DHCP discovery failed: {e}"}
 
-def full_scan(target: str) -> Dict[str, Any]:
+def run_stages(stages: Dict[str, tuple], max_workers: int) -> Dict[str, Any]:
+    """
+    Run named scan stages concurrently, reporting each one as it finishes.
+    Each stage is a tuple of a function followed by its arguments. Stages that
+    an interrupted earlier run already completed are taken from
+    progress.resumed_stages() instead of being run again.
+    """
     results = {}
-    
-    try:
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {
-                executor.submit(ping, target): "ping",
-                executor.submit(traceroute, target): "traceroute",
-                executor.submit(dns_query, target): "dns",
-                executor.submit(nmap_scan, target, ["TCP_SYN_SCAN", "SERVICE_VERSION_INTENSITY", "OS_FINGERPRINTING", "SCRIPT_SCAN", "VULNERABILITY_SCAN"], "-p-"): "nmap_scan",
-                executor.submit(ssl_scan, target): "ssl_scan"
-            }
+    resumed = progress.resumed_stages()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Cancelling the scan drops the stages that have not started; running ones stop when their tools are killed.
+    unregister = progress.on_cancel(lambda: executor.shutdown(wait=False, cancel_futures=True))
+    try:
+        futures = {}
+        for name, (func, *args) in stages.items():
+            if name in resumed:
+                results[name] = resumed[name]
+                progress.report_stage(name, results[name], len(results), len(stages))
+            else:
+                futures[progress.submit(executor, tracing.traced(name, func), *args)] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {"error": str(e)}
+                logger.error(f"Error in {name}: {e}")
+            progress.report_stage(name, results[name], len(results), len(stages))
+    finally:
+        unregister()
+        executor.shutdown(wait=not progress.cancelled())
+    return results
 
-            for future in as_completed(futures):
-                name = futures[future]
-                try:
-                    results[name] = future.result()
-                except Exception as e:
-                    results[name] = {"error": str(e)}
-                    logger.error(f"Error in {name}: {e}")
+# Enumerations full_scan follows its port scan with: each runs on the open ports
+# that are its service's standard ports or where nmap detected its service.
+# Multi-port enumerators get all of those ports in one stage, the others one stage
+# per port; plan_stages runs all of them in a single nmap process.
+FOLLOW_UPS = [
+    (http_enum, {80, 443}, {"http", "https", "http-proxy", "http-alt"}, True),
+    (smb_enum, {445}, {"microsoft-ds", "netbios-ssn"}, True),
+    (mysql_enum, {3306}, {"mysql"}, False),
+    (ftp_anon, {21}, {"ftp"}, False),
+    (snmp_brute, {161}, {"snmp"}, False),
+    (ssh_auth_methods, {22}, {"ssh"}, False),
+    (telnet_brute, {23}, {"telnet"}, False)
+]
+FOLLOW_UP_WORKERS = 4
+
+def follow_up_stages(target: str, records: List[Dict[str, Any]]) -> Dict[str, tuple]:
+    """
+    Stages for run_stages that enumerate the services found by a port scan
+    (records as returned by nmap_scan). An enumerator that runs on several
+    single ports is named e.g. "mysql_enum" for the first and "mysql_enum:3307"
+    for the others.
+    """
+    open_ports = [record for record in records if record.get('state') == 'open']
+    stages = {}
+    for scan_func, standard_ports, services, multi_port in FOLLOW_UPS:
+        ports = sorted({record['port'] for record in open_ports
+                        if record['port'] in standard_ports or record.get('name') in services})
+        if not ports:
+            continue
+        name = scan_func.__name__
+        if multi_port:
+            stages[name] = (scan_func, target, ",".join(map(str, ports)))
+        else:
+            for index, port in enumerate(ports):
+                stages[f"{name}:{port}" if index else name] = (scan_func, target, port)
+    return stages
+
+def full_scan(target: str) -> Dict[str, Any]:
+    try:
+        results = run_stages(plan_stages(target, {
+            "ping": (ping, target),
+            "traceroute": (traceroute, target),
+            "dns": (dns_query, target),
+            "nmap_scan": (nmap_scan, target, ["TCP_SYN_SCAN", "SERVICE_VERSION_INTENSITY", "OS_FINGERPRINTING", "SCRIPT_SCAN", "VULNERABILITY_SCAN"], "-p-"),
+            "ssl_scan": (ssl_scan, target)
+        }), max_workers=5)
 
         # Additional scans based on open ports
         if 'nmap_scan' in results and isinstance(results['nmap_scan'], list):
-            open_ports = [result['port'] for result in results['nmap_scan'] if result['state'] == 'open']
-            
-            additional_scans = {
-                80: http_enum,
-                443: http_enum,
-                445: smb_enum,
-                3306: mysql_enum,
-                21: ftp_anon,
-                161: snmp_brute,
-                22: ssh_auth_methods,
-                23: telnet_brute
-            }
-            
-            for port, scan_func in additional_scans.items():
-                if port in open_ports:
-                    results[scan_func.__name__] = scan_func(target)
+            results.update(run_stages(plan_stages(target, follow_up_stages(target, results['nmap_scan'])),
+                                      max_workers=FOLLOW_UP_WORKERS))
 
         logger.info(f"Full scan completed for {target}")
         return results
@@ -506,7 +898,10 @@ def full_scan(target: str) -> Dict[str, Any]:
 def masscan_port_scan(target: str, ports: str = "1-65535", rate: int = 1000) -> List[Dict[str, Any]]:
     try:
         mas = masscan.PortScanner()
-        mas.scan(target, ports=ports, arguments=f'--rate={rate}')
+        with telemetry.track_tool("masscan"):
+            tracing.count("subprocesses")
+            mas.scan(target, ports=ports, arguments=f'--rate={rate}')
+        progress.check_cancelled()
         results = [{'port': port, 'protocol': proto} for proto in mas[target].keys() for port in mas[target][proto].keys()]
         logger.info(f"Masscan port scan completed for {target}")
         return results
@@ -572,7 +967,7 @@ def metasploit_scan(target: str, module: str, options: Dict[str, str]) -> Dict[s
 def advanced_port_scan(target: str, ports: List[int]) -> List[Dict[str, Any]]:
     try:
         nm = nmap.PortScanner()
-        nm.scan(target, ','.join(map(str, ports)), '-sV -O')
+        _run_nmap(nm, target, ','.join(map(str, ports)), '-sV -O')
         
         results = []
         for host in nm.all_hosts():
@@ -593,6 +988,200 @@ def advanced_port_scan(target: str, ports: List[int]) -> List[Dict[str, Any]]:
         logger.error(f"Error during advanced port scan: {e}")
         return [{"error": f"Advanced port scan failed: {e}"}]
 
+# Scan types that choose how ports are discovered; the others add detection on top of the discovered ports.
+DISCOVERY_SCAN_TYPES = {"TCP_SYN_SCAN", "TCP_CONNECT_SCAN", "UDP_SCAN", "FIN_SCAN", "NULL_SCAN", "XMAS_SCAN", "ACK_SCAN",
+                        "WINDOW_SCAN", "MAIMON_SCAN", "SCTP_INIT_SCAN", "SCTP_COOKIE_ECHO_SCAN"}
+# Port arguments meaning every port, as passed by the composite scans.
+FULL_PORT_RANGES = {"-", "-p-", "1-65535", "0-65535"}
+
+def _merge_options(options: List[str]) -> str:
+    """Join nmap option strings, dropping repeated flags and merging every --script into one."""
+    tokens = shlex.split(" ".join(options))
+    merged, seen, scripts = [], set(), []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        value = tokens[index + 1] if index + 1 < len(tokens) and not tokens[index + 1].startswith("-") else None
+        index += 2 if value is not None else 1
+        if token.startswith("--script="):
+            # --script=name takes no separate value, so the token after it was not consumed.
+            if value is not None:
+                index -= 1
+            token, value = token.split("=", 1)
+        if token == "--script" and value is not None:
+            scripts += [script for script in value.split(",") if script not in scripts]
+        elif (token, value) not in seen:
+            seen.add((token, value))
+            merged += [token] if value is None else [token, value]
+    if scripts:
+        merged += ["--script", ",".join(scripts)]
+    return " ".join(shlex.quote(token) for token in merged)
+
+def _covers_all_ports(ports) -> bool:
+    if ports is None or isinstance(ports, str):
+        return ports is None or ports in FULL_PORT_RANGES
+    try:
+        return len(portscan.parse_ports(list(ports))) == 65535
+    except ValueError:
+        return False
+
+def _outcome(step, *args):
+    try:
+        return step(*args), None
+    except Exception as e:
+        return None, e
+
+def _result(outcome):
+    result, error = outcome
+    if error is not None:
+        raise error
+    return result
+
+class PortScanPlan:
+    """
+    The port work of a composite scan, done once for all of its stages: one
+    discovery sweep over every port, then one service and OS detection pass
+    limited to the open ports it found, with the union of the detection the
+    stages asked for. Whichever stage needs a result first runs that step;
+    the others wait for it and share the result.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.discovery = []
+        self.detection = []
+        self._lock = threading.Lock()
+        self._open = None
+        self._hosts = None
+
+    def request(self, scan_types: List[str] = None, options: str = None):
+        """Add the scan types or raw nmap options a stage asked for."""
+        for scan_type in scan_types or ():
+            option = NMAP_SCAN_TYPES[scan_type.upper()]
+            if scan_type.upper() in DISCOVERY_SCAN_TYPES:
+                self.discovery.append(option)
+            elif scan_type.upper() != "FULL_PORT_SCAN":
+                self.detection.append(option)
+        if options:
+            self.detection.append(options)
+
+    def open_ports(self) -> List[Dict[str, Any]]:
+        """Hosts found by the discovery sweep (see nmapxml.parse_host), with their open ports."""
+        with self._lock:
+            if self._open is None:
+                self._open = _outcome(self._discover)
+        return _result(self._open)
+
+    def hosts(self) -> List[Dict[str, Any]]:
+        """Hosts with their open ports and what the detection pass found about them."""
+        open_hosts = self.open_ports()
+        with self._lock:
+            if self._hosts is None:
+                self._hosts = _outcome(self._detect, open_hosts)
+        return _result(self._hosts)
+
+    def _discover(self) -> List[Dict[str, Any]]:
+        options = _merge_options((self.discovery or ["-sS"]) + ["-T4", "--open"])
+        with tracing.span("port_discovery"):
+            return list(_stream_nmap(self.target, ports="1-65535", arguments=options))
+
+    def _detect(self, open_hosts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        ports = {(port["protocol"], port["port"]) for host in open_hosts for port in host["ports"]}
+        if not ports or not self.detection:
+            return open_hosts
+        # One pass over the union of every host's open ports; nmap's T:/U: prefixes keep protocols apart.
+        spec = ",".join(f"{'U' if protocol == 'udp' else 'T'}:{port}" for protocol, port in sorted(ports))
+        targets = " ".join(host["host"] for host in open_hosts)
+        options = _merge_options(self.discovery + self.detection + ["--open"])
+        with tracing.span("service_detection"):
+            return list(_stream_nmap(targets, ports=spec, arguments=options))
+
+class NseBatch:
+    """
+    The NSE enumerations of a composite scan's stages against one target, run
+    together by enumerate_services when the first of those stages needs its
+    result; the others wait for it and take their own result from the batch.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.bindings = {}
+        self._lock = threading.Lock()
+        self._results = None
+
+    def add(self, name: str, enumeration: str, ports=None):
+        self.bindings[name] = (enumeration, ports)
+
+    def result(self, name: str) -> Any:
+        with self._lock:
+            if self._results is None:
+                with tracing.span("nse_enumeration"):
+                    self._results = _outcome(enumerate_services, self.target, self.bindings)
+        return _result(self._results)[name]
+
+def _planned_nmap_scan(plan: PortScanPlan) -> Union[List[Dict[str, Any]], Dict[str, str]]:
+    try:
+        return [record for host in plan.hosts() for record in _port_records(host)]
+    except Exception as e:
+        logger.error(f"Nmap scan error: {e}")
+        return {"error": f"Nmap scan error: {e}"}
+
+def _planned_masscan_port_scan(plan: PortScanPlan) -> List[Dict[str, Any]]:
+    try:
+        return [{"port": port["port"], "protocol": port["protocol"]}
+                for host in plan.open_ports() for port in host["ports"]]
+    except Exception as e:
+        logger.error(f"Error during masscan port scan: {e}")
+        return [{"error": f"Masscan port scan failed: {e}"}]
+
+def _planned_advanced_port_scan(plan: PortScanPlan) -> List[Dict[str, Any]]:
+    try:
+        return [{
+            "port": port["port"],
+            "state": port["state"],
+            "service": port["name"],
+            "version": port["version"],
+            "os": host["osmatch"][0]["name"] if host["osmatch"] else "Unknown"
+        } for host in plan.hosts() for port in host["ports"]]
+    except Exception as e:
+        logger.error(f"Error during advanced port scan: {e}")
+        return [{"error": f"Advanced port scan failed: {e}"}]
+
+def plan_stages(target: str, stages: Dict[str, tuple]) -> Dict[str, tuple]:
+    """
+    Rewrite the stages of a composite scan for run_stages so that the ones
+    that each sweep every port of the target (nmap_scan with -p-,
+    masscan_port_scan and advanced_port_scan over the full range) share one
+    PortScanPlan, and the NSE enumerations of NSE_ENUMERATIONS run in one
+    NseBatch. Their results keep the shapes of the functions they replace.
+    """
+    plan = PortScanPlan(target)
+    batch = NseBatch(target)
+    resumed = progress.resumed_stages()
+    planned = {}
+    for name, (func, *args) in stages.items():
+        if args and args[0] == target:
+            if func.__module__ == __name__ and func.__name__ in NSE_ENUMERATIONS:
+                # Stages run_stages takes from an earlier run stay out of the batch.
+                if name not in resumed:
+                    batch.add(name, func.__name__, args[1] if len(args) > 1 else None)
+                planned[name] = (batch.result, name)
+                continue
+            if func is nmap_scan and (_covers_all_ports(args[2] if len(args) > 2 else "")
+                                      or "FULL_PORT_SCAN" in (args[1] if len(args) > 1 and args[1] else [])):
+                plan.request(scan_types=args[1] if len(args) > 1 else None, options=args[3] if len(args) > 3 else None)
+                planned[name] = (_planned_nmap_scan, plan)
+                continue
+            if func is masscan_port_scan and _covers_all_ports(args[1] if len(args) > 1 else None):
+                planned[name] = (_planned_masscan_port_scan, plan)
+                continue
+            if func is advanced_port_scan and len(args) > 1 and _covers_all_ports(args[1]):
+                plan.request(options="-sV -O")
+                planned[name] = (_planned_advanced_port_scan, plan)
+                continue
+        planned[name] = (func, *args)
+    return planned
+
 def wifi_network_scan() -> List[Dict[str, Any]]:
     try:
         networks = []
@@ -611,30 +1200,20 @@ def wifi_network_scan() -> List[Dict[str, Any]]:
         return [{"error": f"Wi-Fi network scan failed: {e}"}]
 
 def comprehensive_network_scan(target: str) -> Dict[str, Any]:
-    results = {}
-    
-    try:
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {
-                executor.submit(nmap_scan, target, ["TCP_SYN_SCAN", "SERVICE_VERSION_INTENSITY", "OS_FINGERPRINTING", "SCRIPT_SCAN", "VULNERABILITY_SCAN"], "-p-"): "nmap_scan",
-                executor.submit(masscan_port_scan, target): "masscan_scan",
-                executor.submit(ssl_scan, target): "ssl_scan",
-                executor.submit(dns_brute, target): "dns_brute",
-                executor.submit(smb_enum, target): "smb_enum",
-                executor.submit(http_enum, target): "http_enum",
-                executor.submit(advanced_port_scan, target, range(1, 65536)): "advanced_port_scan",
-                executor.submit(network_interface_scan): "network_interfaces",
-                executor.submit(wifi_network_scan): "wifi_networks",
-                executor.submit(metasploit_scan, target, 'auxiliary/scanner/portscan/tcp', {'THREADS': '10'}): "metasploit_portscan"
-            }
-
-            for future in as_completed(futures):
-                name = futures[future]
-                try:
-                    results[name] = future.result()
-                except Exception as e:
-                    results[name] = {"error": str(e)}
-                    logger.error(f"Error in {name}: {e}")
+    try:
+        # The nmap, masscan and advanced port scans all sweep every port; plan_stages makes them share one sweep.
+        results = run_stages(plan_stages(target, {
+            "nmap_scan": (nmap_scan, target, ["TCP_SYN_SCAN", "SERVICE_VERSION_INTENSITY", "OS_FINGERPRINTING", "SCRIPT_SCAN", "VULNERABILITY_SCAN"], "-p-"),
+            "masscan_scan": (masscan_port_scan, target),
+            "ssl_scan": (ssl_scan, target),
+            "dns_brute": (dns_brute, target),
+            "smb_enum": (smb_enum, target),
+            "http_enum": (http_enum, target),
+            "advanced_port_scan": (advanced_port_scan, target, range(1, 65536)),
+            "network_interfaces": (network_interface_scan,),
+            "wifi_networks": (wifi_network_scan,),
+            "metasploit_portscan": (metasploit_scan, target, 'auxiliary/scanner/portscan/tcp', {'THREADS': '10'})
+        }), max_workers=10)
 
         logger.info(f"Comprehensive network scan completed for {target}")
         return results
@@ -0,0 +1,74 @@
+import xml.etree.ElementTree as ET
+from typing import Any, BinaryIO, Dict, Iterator
+
+ParseError = ET.ParseError
+
+# Bytes read from nmap's output per call; read1 returns whatever is available, so this is only an upper bound.
+READ_SIZE = 64 * 1024
+
+def _scripts(parent: ET.Element) -> Dict[str, str]:
+    if parent is None:
+        return {}
+    return {script.get("id"): script.get("output", "") for script in parent.findall("script")}
+
+def parse_host(elem: ET.Element) -> Dict[str, Any]:
+    """Convert a <host> element of nmap's XML output to a dict."""
+    addresses = {address.get("addrtype"): address.get("addr") for address in elem.findall("address")}
+    status = elem.find("status")
+    host = {
+        "host": addresses.get("ipv4") or addresses.get("ipv6") or next(iter(addresses.values()), ""),
+        "addresses": addresses,
+        "hostnames": [{"name": name.get("name"), "type": name.get("type")}
+                      for name in elem.findall("hostnames/hostname")],
+        "status": {"state": status.get("state"), "reason": status.get("reason")} if status is not None else {},
+        "ports": [],
+        "hostscript": [{"id": script_id, "output": output}
+                       for script_id, output in _scripts(elem.find("hostscript")).items()],
+        "osmatch": [{"name": match.get("name"), "accuracy": match.get("accuracy")}
+                    for match in elem.findall("os/osmatch")]
+    }
+    for port in elem.findall("ports/port"):
+        state = port.find("state")
+        service = port.find("service")
+        if service is None:
+            service = ET.Element("service")
+        host["ports"].append({
+            "port": int(port.get("portid")),
+            "protocol": port.get("protocol"),
+            "state": state.get("state") if state is not None else "",
+            "reason": state.get("reason", "") if state is not None else "",
+            "name": service.get("name", ""),
+            "product": service.get("product", ""),
+            "version": service.get("version", ""),
+            "extrainfo": service.get("extrainfo", ""),
+            "cpe": " ".join(cpe.text or "" for cpe in service.findall("cpe")),
+            "script": _scripts(port)
+        })
+    return host
+
+def iter_hosts(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """
+    Parse nmap's XML output (-oX -) while it is being written and yield each
+    host as soon as its <host> element is complete. Finished elements are
+    dropped from the tree, so memory use does not grow with the number of hosts.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        chunk = read(READ_SIZE)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+            elif elem.tag == "host":
+                yield parse_host(elem)
+                if root is not None and elem is not root:
+                    try:
+                        root.remove(elem)
+                    except ValueError:
+                        elem.clear()
+    parser.close()
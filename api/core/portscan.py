@@ -0,0 +1,294 @@
+import asyncio
+import contextvars
+import functools
+import ipaddress
+import itertools
+import logging
+import operator
+import queue
+import re
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from . import progress, tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = "1-1024"
+# Connection attempts in flight at once, overall and against a single host.
+DEFAULT_CONCURRENCY = 500
+DEFAULT_PER_HOST = 256
+# Timeout of a connection attempt before a host has answered one; afterwards it
+# follows the host's measured round-trip time within [MIN_TIMEOUT, MAX_TIMEOUT].
+DEFAULT_TIMEOUT = 1.0
+MIN_TIMEOUT = 0.25
+MAX_TIMEOUT = 3.0
+# Refuse target specifications that expand to more hosts than this, e.g. a /8.
+MAX_HOSTS = 65536
+# nmap-style IPv4 octet ranges, e.g. 10.0.0-3.1-254 or 192.168.1.1,5,9.
+OCTET_RANGE = re.compile(r"^[\d,-]+\.[\d,-]+\.[\d,-]+\.[\d,-]+$")
+# File descriptors left for the rest of the process when capping concurrency.
+RESERVED_FDS = 64
+
+def parse_ports(ports: Union[str, int, Iterable[int], None]) -> List[int]:
+    """Parse "22,80,8000-8100", a single port or a list of ports into a sorted list without duplicates."""
+    if ports is None or ports == "":
+        ports = DEFAULT_PORTS
+    if isinstance(ports, int):
+        ports = [ports]
+    if isinstance(ports, str):
+        parsed = set()
+        for part in ports.replace(" ", "").split(","):
+            if not part:
+                continue
+            first, sep, last = part.partition("-")
+            try:
+                start, end = int(first or 1), int(last or 65535) if sep else int(first)
+            except ValueError:
+                raise ValueError(f"Invalid port range: {part}")
+            if start > end:
+                raise ValueError(f"Invalid port range: {part}")
+            parsed.update(range(start, end + 1))
+        ports = parsed
+    ports = sorted({int(port) for port in ports})
+    if not ports:
+        raise ValueError("No ports to scan")
+    if ports[0] < 1 or ports[-1] > 65535:
+        raise ValueError("Ports must be between 1 and 65535")
+    return ports
+
+def _octet_values(spec: str) -> List[int]:
+    values = set()
+    for item in spec.split(","):
+        if not item:
+            raise ValueError(f"Invalid octet range: {spec}")
+        first, sep, last = item.partition("-")
+        start, end = int(first or 0), int(last or 255) if sep else int(first or 0)
+        if not 0 <= start <= end <= 255:
+            raise ValueError(f"Invalid octet range: {item}")
+        values.update(range(start, end + 1))
+    return sorted(values)
+
+def _expand_octets(target: str) -> List[str]:
+    """Expand an nmap-style octet range such as "10.0.0-3.1-254" or "192.168.1.1,5,9"."""
+    octets = [_octet_values(spec) for spec in target.split(".")]
+    if functools.reduce(operator.mul, map(len, octets)) > MAX_HOSTS:
+        raise ValueError(f"{target} has more than {MAX_HOSTS} addresses")
+    return [".".join(map(str, address)) for address in itertools.product(*octets)]
+
+def parse_targets(targets: Union[str, Iterable[str]]) -> List[str]:
+    """
+    Expand "10.0.0.1 10.0.1.0/28 10.0.2.1-20 example.com" or a list of the same
+    into individual hosts. Besides CIDR ranges, nmap-style octet ranges such as
+    10.0.0-3.1-254 are expanded.
+    """
+    if isinstance(targets, str):
+        # Commas separate targets too, except inside an octet range such as 192.168.1.1,5,9.
+        tokens = [token.strip(",") for token in targets.split()]
+        targets = [target for token in tokens for target in ([token] if OCTET_RANGE.match(token) else token.split(","))]
+    hosts = []
+    for target in targets or ():
+        if not target:
+            continue
+        try:
+            network = ipaddress.ip_network(str(target), strict=False)
+        except ValueError:
+            if OCTET_RANGE.match(str(target)):
+                hosts.extend(_expand_octets(str(target)))
+            else:
+                hosts.append(str(target))
+            if len(hosts) > MAX_HOSTS:
+                raise ValueError(f"Targets expand to more than {MAX_HOSTS} hosts")
+            continue
+        if network.num_addresses > MAX_HOSTS:
+            raise ValueError(f"{target} has more than {MAX_HOSTS} addresses")
+        hosts.extend(str(address) for address in (network.hosts() if network.num_addresses > 2 else network))
+        if len(hosts) > MAX_HOSTS:
+            raise ValueError(f"Targets expand to more than {MAX_HOSTS} hosts")
+    if not hosts:
+        raise ValueError("No targets to scan")
+    return hosts
+
+def _fd_limit() -> Optional[int]:
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return None
+    return None if soft == resource.RLIM_INFINITY else soft
+
+class AdaptiveTimeout:
+    """
+    Connection timeout of one host, derived from the round-trip times of its
+    completed handshakes the way TCP derives its retransmission timeout
+    (RFC 6298): the smoothed RTT plus four times its variation.
+    """
+
+    def __init__(self, initial: float = DEFAULT_TIMEOUT, minimum: float = MIN_TIMEOUT, maximum: float = MAX_TIMEOUT):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.timeout = initial
+        self.srtt = None
+        self.rttvar = None
+
+    def observe(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.timeout = min(self.maximum, max(self.minimum, self.srtt + 4 * self.rttvar))
+
+class ConnectScanner:
+    """
+    TCP connect scanner that keeps up to `concurrency` connection attempts in
+    flight on one event loop, at most `per_host` of them against any one host.
+
+    Ports are probed in an order that interleaves the hosts, so a scan of many
+    hosts spreads its load instead of working through them one at a time. A
+    port is "open" when the handshake completes, "closed" when it is refused
+    and "filtered" when the attempt times out or the host is unreachable.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, per_host: int = DEFAULT_PER_HOST,
+                 timeout: float = DEFAULT_TIMEOUT, include_closed: bool = False):
+        limit = _fd_limit()
+        if limit is not None:
+            # Every attempt holds a socket; running out of descriptors would report open ports as filtered.
+            concurrency = min(concurrency, max(1, limit - RESERVED_FDS))
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.include_closed = include_closed
+        self.probed = 0
+        self.states = {"open": 0, "closed": 0, "filtered": 0}
+
+    async def scan(self, hosts: List[str], ports: List[int], emit: Callable[[Dict[str, Any]], None]) -> None:
+        """Probe every port of every host, passing each open (and optionally closed) port to emit as found."""
+        loop = asyncio.get_running_loop()
+        addresses = {}
+        for host in hosts:
+            try:
+                infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+                addresses[host] = (infos[0][0], infos[0][4][0])
+            except (OSError, IndexError) as e:
+                logger.warning(f"Cannot resolve {host}: {e}")
+                emit({"host": host, "error": f"Cannot resolve {host}: {e}"})
+        limits = {host: asyncio.Semaphore(self.per_host) for host in addresses}
+        timeouts = {host: AdaptiveTimeout(self.timeout) for host in addresses}
+        probes = ((host, port) for port in ports for host in addresses)
+
+        async def work():
+            # Workers share one iterator of probes, so at most `concurrency` sockets are open at once.
+            for host, port in probes:
+                async with limits[host]:
+                    state = await self._probe(loop, addresses[host], port, timeouts[host])
+                self.probed += 1
+                self.states[state] += 1
+                if state == "open" or (state == "closed" and self.include_closed):
+                    emit({"host": host, "port": port, "state": state})
+
+        workers = min(self.concurrency, len(addresses) * len(ports))
+        await asyncio.gather(*(work() for _ in range(workers)))
+
+    async def _probe(self, loop, address, port: int, timeout: AdaptiveTimeout) -> str:
+        family, ip = address
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        tracing.count("connections")
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout.timeout)
+            timeout.observe(time.perf_counter() - start)
+            return "open"
+        except ConnectionRefusedError:
+            # A reset answers as quickly as an accept, so it measures the round trip too.
+            timeout.observe(time.perf_counter() - start)
+            return "closed"
+        except (asyncio.TimeoutError, OSError):
+            return "filtered"
+        finally:
+            sock.close()
+
+def iter_port_scan(targets: Union[str, Iterable[str]], ports: Union[str, Iterable[int], None] = None,
+                   concurrency: Optional[int] = None, per_host: Optional[int] = None,
+                   timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Like port_scan, but yields each open port as soon as it is found. The scan
+    runs on an event loop in its own thread and stops when the generator is
+    closed or the scan is cancelled. Errors are raised instead of being returned.
+    """
+    hosts, port_list = parse_targets(targets), parse_ports(ports)
+    scanner = ConnectScanner(concurrency or DEFAULT_CONCURRENCY, per_host or DEFAULT_PER_HOST,
+                             timeout or DEFAULT_TIMEOUT)
+    found = queue.Queue()
+    finished = object()
+    loop = asyncio.new_event_loop()
+    main = loop.create_task(scanner.scan(hosts, port_list, found.put))
+
+    def run():
+        try:
+            loop.run_until_complete(main)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            found.put(e)
+        finally:
+            try:
+                # Let the probes interrupted by a cancellation close their sockets, as asyncio.run does.
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.close()
+            finally:
+                found.put(finished)
+
+    def stop():
+        try:
+            loop.call_soon_threadsafe(main.cancel)
+        except RuntimeError:
+            # The loop has already finished.
+            pass
+
+    logger.info(f"Starting connect scan of {len(hosts)} hosts x {len(port_list)} ports "
+                f"with {scanner.concurrency} connections")
+    start = time.perf_counter()
+    # The loop thread runs in a copy of this context, so its connections are counted in the scan's trace.
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name="port-scan", daemon=True)
+    unregister = progress.on_cancel(stop)
+    thread.start()
+    try:
+        while True:
+            item = found.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        unregister()
+        stop()
+        thread.join()
+    progress.check_cancelled()
+    logger.info(f"Connect scan completed in {time.perf_counter() - start:.1f}s: {scanner.probed} ports probed, "
+                f"{scanner.states['open']} open, {scanner.states['closed']} closed, "
+                f"{scanner.states['filtered']} filtered")
+
+def port_scan(targets: Union[str, Iterable[str]], ports: Union[str, Iterable[int], None] = None,
+              concurrency: Optional[int] = None, per_host: Optional[int] = None,
+              timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    TCP connect scan of one or more hosts (names, addresses or CIDR ranges)
+    over the given ports ("1-1024" by default), without nmap or raw sockets.
+    """
+    try:
+        return list(iter_port_scan(targets, ports, concurrency, per_host, timeout))
+    except ValueError as e:
+        return [{"error": str(e)}]
+    except Exception as e:
+        logger.error(f"Error during port scan: {e}")
+        return [{"error": f"Port scan failed: {e}"}]
@@ -0,0 +1,150 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# The listener receives stage updates from whichever scan runs in the current context.
+_listener = contextvars.ContextVar("scan_listener", default=None)
+# The cancel token of whichever scan runs in the current context.
+_token = contextvars.ContextVar("scan_cancel_token", default=None)
+
+class Cancelled(BaseException):
+    """
+    Raised inside a scan that has been cancelled. Like KeyboardInterrupt it is
+    not an Exception, so the broad error handling in the scan functions does
+    not turn it into an error result.
+    """
+
+class CancelToken:
+    """
+    Cancels a running scan. Callbacks registered with on_cancel, such as killing
+    a subprocess, run once when the token is cancelled.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register a callback and return a function that unregisters it. The
+        callback runs immediately if the token is already cancelled.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+class ProgressListener:
+    """
+    Base class for objects that want to observe the stages of a composite scan.
+    """
+    def on_stage(self, name: str, result: Any, completed: Optional[int], total: Optional[int]) -> None:
+        pass
+
+    def resumed_stages(self) -> Dict[str, Any]:
+        """
+        Results of stages finished by an earlier, interrupted run of the same scan.
+        """
+        return {}
+
+@contextmanager
+def listen(listener: ProgressListener):
+    """
+    Route stage reports made inside the block to the given listener.
+    """
+    token = _listener.set(listener)
+    try:
+        yield listener
+    finally:
+        _listener.reset(token)
+
+def current_listener() -> Optional[ProgressListener]:
+    return _listener.get()
+
+def report_stage(name: str, result: Any = None, completed: Optional[int] = None, total: Optional[int] = None) -> None:
+    """
+    Report that a stage of the running scan has finished.
+    """
+    check_cancelled()
+    listener = _listener.get()
+    if listener is not None:
+        listener.on_stage(name, result, completed, total)
+
+def resumed_stages() -> Dict[str, Any]:
+    """
+    Return the stages the running scan may skip because an earlier run already completed them.
+    """
+    listener = _listener.get()
+    if listener is None:
+        return {}
+    return listener.resumed_stages()
+
+@contextmanager
+def cancellable(token: CancelToken):
+    """
+    Make the given token cancel the scans started inside the block.
+    """
+    reset = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset)
+
+def current_token() -> Optional[CancelToken]:
+    return _token.get()
+
+def cancelled() -> bool:
+    token = _token.get()
+    return token is not None and token.cancelled
+
+def check_cancelled() -> None:
+    """
+    Raise Cancelled if the running scan has been cancelled.
+    """
+    if cancelled():
+        raise Cancelled()
+
+def on_cancel(callback: Callable[[], None]) -> Callable[[], None]:
+    """
+    Run callback when the running scan is cancelled. Returns a function that unregisters it.
+    """
+    token = _token.get()
+    if token is None:
+        return lambda: None
+    return token.on_cancel(callback)
+
+def _run_unless_cancelled(fn, *args, **kwargs):
+    check_cancelled()
+    return fn(*args, **kwargs)
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    Submit fn to an executor so that it runs in a copy of the caller's context.
+    Tasks that only start after the scan was cancelled raise Cancelled instead of running.
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, _run_unless_cancelled, fn, *args, **kwargs)
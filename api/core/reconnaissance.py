@@ -30,6 +30,7 @@ import requests_html
 import passivetotal
 import virustotal_python
 import spyse
+from . import progress, telemetry, tracing
 
 # Set up logging with more detailed formatting
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -394,17 +395,17 @@ def check_ssl_vulnerabilities(domain):
     vulnerabilities = []
     try:
         # Check for Heartbleed
-        heartbleed = subprocess.run(['sslyze', '--heartbleed', domain], capture_output=True, text=True)
+        heartbleed = telemetry.run_tool(['sslyze', '--heartbleed', domain], capture_output=True, text=True)
         if 'VULNERABLE' in heartbleed.stdout:
             vulnerabilities.append('Heartbleed')
         
         # Check for POODLE
-        poodle = subprocess.run(['sslyze', '--fallback', domain], capture_output=True, text=True)
+        poodle = telemetry.run_tool(['sslyze', '--fallback', domain], capture_output=True, text=True)
         if 'VULNERABLE' in poodle.stdout:
             vulnerabilities.append('POODLE')
         
         # Check for FREAK
-        freak = subprocess.run(['sslyze', '--freak', domain], capture_output=True, text=True)
+        freak = telemetry.run_tool(['sslyze', '--freak', domain], capture_output=True, text=True)
         if 'VULNERABLE' in freak.stdout:
             vulnerabilities.append('FREAK')
         
@@ -414,32 +415,44 @@ def check_ssl_vulnerabilities(domain):
     
     return vulnerabilities
 
+SUBDOMAIN_STAGES = 6
+
+def _subdomain_stage(name, source, completed):
+    """Run one subdomain source, or reuse its result from an interrupted earlier run."""
+    resumed = progress.resumed_stages()
+    progress.check_cancelled()
+    with tracing.span(name):
+        found = resumed[name] if name in resumed else sorted(source())
+    progress.report_stage(name, found, completed, SUBDOMAIN_STAGES)
+    return found
+
 def comprehensive_subdomain_enumeration(domain):
     """Enumerate subdomains using multiple tools and techniques."""
     subdomains = set()
     
     # Sublist3r
-    subdomains.update(sublist3r.main(domain, 40, savefile=None, ports=None, silent=True, verbose=False, enable_bruteforce=False, engines=None))
+    def run_sublist3r():
+        with telemetry.track_tool("sublist3r"):
+            return sublist3r.main(domain, 40, savefile=None, ports=None, silent=True, verbose=False, enable_bruteforce=False, engines=None)
+    subdomains.update(_subdomain_stage("sublist3r", run_sublist3r, 1))
     
     # Amass
-    amass_output = subprocess.run(['amass', 'enum', '-d', domain], capture_output=True, text=True)
-    subdomains.update(amass_output.stdout.splitlines())
+    amass = lambda: telemetry.run_tool(['amass', 'enum', '-d', domain], capture_output=True, text=True).stdout.splitlines()
+    subdomains.update(_subdomain_stage("amass", amass, 2))
     
     # Subfinder
-    subfinder_output = subprocess.run(['subfinder', '-d', domain], capture_output=True, text=True)
-    subdomains.update(subfinder_output.stdout.splitlines())
+    subfinder = lambda: telemetry.run_tool(['subfinder', '-d', domain], capture_output=True, text=True).stdout.splitlines()
+    subdomains.update(_subdomain_stage("subfinder", subfinder, 3))
     
     # Asynchronous DNS brute-force
     wordlist = load_subdomain_wordlist()
-    brute_force_subdomains = asyncio.run(async_dns_brute_force(domain, wordlist))
-    subdomains.update(brute_force_subdomains)
+    subdomains.update(_subdomain_stage("dns_brute_force", lambda: asyncio.run(async_dns_brute_force(domain, wordlist)), 4))
     
     # Censys subdomain enumeration
-    censys_subdomains = censys_subdomain_enum(domain)
-    subdomains.update(censys_subdomains)
+    subdomains.update(_subdomain_stage("censys", lambda: censys_subdomain_enum(domain), 5))
     
     # Certificate Transparency logs
-    ct_subdomains = certificate_transparency_enum(domain)
-    subdomains.update(ct_subdomains)
+    subdomains.update(_subdomain_stage("certificate_transparency", lambda: certificate_transparency_enum(domain), 6))
     
-    logger.info(f"Comprehensive subdomain enumeration for {domain} completed.")
\ No newline at end of file
+    logger.info(f"Comprehensive subdomain enumeration for {domain} completed.")
+    return sorted(subdomains)
\ No newline at end of file
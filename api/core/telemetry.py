@@ -0,0 +1,103 @@
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List
+
+from . import progress, tracing
+
+# Callables invoked as observer(tool, seconds, failed) after every external tool run.
+_observers: List[Callable[[str, float, bool], None]] = []
+_lock = threading.Lock()
+
+def add_observer(observer: Callable[[str, float, bool], None]) -> None:
+    with _lock:
+        _observers.append(observer)
+
+def remove_observer(observer: Callable[[str, float, bool], None]) -> None:
+    with _lock:
+        if observer in _observers:
+            _observers.remove(observer)
+
+@contextmanager
+def track_tool(tool: str):
+    """
+    Time a call to an external tool such as nmap or sslyze and notify the observers.
+    The call is also recorded as a span when the scan is traced.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        with tracing.span(tool, "tool"):
+            yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            observers = list(_observers)
+        for observer in observers:
+            observer(tool, elapsed, failed)
+
+def tool_name(args: List[str]) -> str:
+    """The name a command is recorded under: its executable without the directory, e.g. nmap for /usr/bin/nmap."""
+    return os.path.basename(args[0])
+
+def run_tool(args: List[str], input=None, timeout: float = None, check: bool = False, capture_output: bool = False,
+             **kwargs) -> subprocess.CompletedProcess:
+    """
+    Run an external command like subprocess.run and record its timing under the command name.
+    The process is killed if the running scan is cancelled, and Cancelled is raised.
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    with track_tool(tool_name(args)):
+        progress.check_cancelled()
+        tracing.count("subprocesses")
+        with subprocess.Popen(args, **kwargs) as process:
+            unregister = progress.on_cancel(process.kill)
+            try:
+                stdout, stderr = process.communicate(input, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                raise
+            finally:
+                unregister()
+            returncode = process.wait()
+        progress.check_cancelled()
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+@contextmanager
+def stream_tool(args: List[str], **kwargs):
+    """
+    Start an external command whose output is read while it runs, e.g. to parse
+    results incrementally, and yield the process. Its stderr is collected on a
+    thread and set as `process.stderr_output` when the block ends. Like run_tool,
+    the run is timed and the process is killed if the scan is cancelled; it is
+    also killed if the block is left before the process exits.
+    """
+    with track_tool(tool_name(args)):
+        progress.check_cancelled()
+        tracing.count("subprocesses")
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs) as process:
+            errors = []
+            reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+            reader.start()
+            unregister = progress.on_cancel(process.kill)
+            try:
+                yield process
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                unregister()
+                process.wait()
+                reader.join()
+                process.stderr_output = errors[0] if errors else None
+        progress.check_cancelled()
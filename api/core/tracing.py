@@ -0,0 +1,150 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# The trace being recorded in the current context, and the innermost open span.
+_trace = contextvars.ContextVar("scan_trace", default=None)
+_span = contextvars.ContextVar("scan_span", default=None)
+
+class Span:
+    def __init__(self, span_id: int, name: str, category: str, parent: Optional["Span"]):
+        self.id = span_id
+        self.name = name
+        self.category = category
+        self.parent = parent.id if parent is not None else None
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end = None
+        self.counters = Counter()
+
+class Trace:
+    """
+    Spans recorded while a scan runs: one per stage and per external tool run,
+    each with its timing and counters such as subprocesses started and packets sent.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def open(self, name: str, category: str, parent: Optional[Span]) -> Span:
+        with self._lock:
+            self._next_id += 1
+            return Span(self._next_id, name, category, parent)
+
+    def close(self, span: Span):
+        span.end = time.perf_counter()
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, span: Span, name: str, n: int):
+        with self._lock:
+            span.counters[name] += n
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary attached to results as `_trace`; times are seconds from the start of the trace."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+            totals = Counter()
+            for span in spans:
+                totals.update(span.counters)
+            return {
+                "duration": round(time.perf_counter() - self.start, 6),
+                "counters": dict(totals),
+                "spans": [{
+                    "id": span.id,
+                    "parent": span.parent,
+                    "name": span.name,
+                    "category": span.category,
+                    "thread": span.thread,
+                    "start": round(span.start - self.start, 6),
+                    "duration": round(span.end - span.start, 6),
+                    "counters": dict(span.counters)
+                } for span in spans]
+            }
+
+@contextmanager
+def trace():
+    """
+    Record the spans of everything run inside the block, including work submitted
+    with progress.submit, which runs in a copy of this context.
+    """
+    recording = Trace()
+    token = _trace.set(recording)
+    try:
+        yield recording
+    finally:
+        _trace.reset(token)
+
+def active() -> bool:
+    return _trace.get() is not None
+
+@contextmanager
+def span(name: str, category: str = "stage"):
+    """Time the block as a span nested in the current one. Does nothing when no trace is recorded."""
+    recording = _trace.get()
+    if recording is None:
+        yield None
+        return
+    current = recording.open(name, category, _span.get())
+    token = _span.set(current)
+    try:
+        yield current
+    finally:
+        _span.reset(token)
+        recording.close(current)
+
+def traced(name: str, func: Callable[..., Any], category: str = "stage") -> Callable[..., Any]:
+    """Wrap func so that every call is recorded as a span."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name, category):
+            return func(*args, **kwargs)
+    return wrapper
+
+def count(name: str, n: int = 1) -> None:
+    """Add n to a counter of the innermost open span, e.g. count("packets_sent")."""
+    recording = _trace.get()
+    current = _span.get()
+    if recording is not None and current is not None:
+        recording.count(current, name, n)
+
+def attach(result: Any, recording: Trace) -> Any:
+    """
+    Return the result with the trace summary under `_trace`. Results that are not
+    objects are wrapped as {"result": ..., "_trace": ...}; a result that already
+    carries a trace (e.g. from a remote worker) is returned unchanged.
+    """
+    if isinstance(result, dict):
+        if "_trace" in result:
+            return result
+        return {**result, "_trace": recording.to_dict()}
+    return {"result": result, "_trace": recording.to_dict()}
+
+def trace_summary(result: Any) -> Optional[Dict[str, Any]]:
+    """The `_trace` summary carried by a result, or None if it has none."""
+    summary = result.get("_trace") if isinstance(result, dict) else None
+    return summary if isinstance(summary, dict) else None
+
+def to_chrome(summary: Dict[str, Any], pid: int = 1) -> Dict[str, Any]:
+    """
+    Convert a `_trace` summary to Chrome trace-event JSON, which chrome://tracing
+    and Perfetto show as a flame chart with one row per thread.
+    """
+    events = [{
+        "name": span["name"],
+        "cat": span["category"],
+        "ph": "X",
+        "ts": int(span["start"] * 1e6),
+        "dur": int(span["duration"] * 1e6),
+        "pid": pid,
+        "tid": span["thread"],
+        "args": span["counters"]
+    } for span in summary.get("spans", [])]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
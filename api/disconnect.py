@@ -0,0 +1,91 @@
+import logging
+import selectors
+import socket
+import threading
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+class DisconnectWatcher:
+    """
+    Watches the sockets of in-progress requests from a single thread and calls
+    their callback as soon as the client closes the connection.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._selector.register(self._wake_recv, selectors.EVENT_READ)
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='disconnect-watcher', daemon=True)
+        self._thread.start()
+
+    def watch(self, sock: socket.socket, on_disconnect: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call on_disconnect if the peer of `sock` hangs up. Returns a function
+        that stops watching; it must be called before the socket is reused.
+        """
+        with self._lock:
+            if self._closed:
+                return lambda: None
+            self._selector.register(sock, selectors.EVENT_READ, on_disconnect)
+        self._wake()
+        return lambda: self._unwatch(sock)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wake()
+        self._thread.join(timeout=1)
+
+    def _unwatch(self, sock: socket.socket):
+        with self._lock:
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                return
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_send.send(b'\0')
+        except OSError:
+            pass
+
+    def _loop(self):
+        while True:
+            events = self._selector.select()
+            with self._lock:
+                if self._closed:
+                    break
+                hung_up = []
+                for key, _ in events:
+                    if key.fileobj is self._wake_recv:
+                        try:
+                            while self._wake_recv.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    # Readable with no data means the client closed its end. Any
+                    # other bytes are a pipelined request, so stop watching and
+                    # leave them for the handler.
+                    try:
+                        closed = key.fileobj.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        closed = True
+                    self._selector.unregister(key.fileobj)
+                    if closed:
+                        hung_up.append(key.data)
+            for on_disconnect in hung_up:
+                try:
+                    on_disconnect()
+                except Exception as e:
+                    logger.error(f"Disconnect callback failed: {e}")
+        self._selector.close()
+        self._wake_recv.close()
+        self._wake_send.close()
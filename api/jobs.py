@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import is_cacheable
+from core import progress
+from jobstore import JobStore
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+class Job(progress.ProgressListener):
+    """A single API request executed in the background."""
+
+    def __init__(self, route: str, params: Dict[str, Any], store: Optional[JobStore] = None):
+        self.store = store
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.params = params
+        self.status = JOB_QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {"stage": None, "completed": 0, "total": None}
+        self.partial_results = {}
+        self.result = None
+        self.error = None
+        self._resumed = {}
+        self.token = progress.CancelToken()
+        self.future = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], stages: Dict[str, Any], store: Optional[JobStore] = None) -> "Job":
+        job = cls(record["route"], record["params"], store)
+        job.id = record["id"]
+        job.status = record["status"]
+        job.created = record["created"]
+        job.started = record["started"]
+        job.finished = record["finished"]
+        job.progress = record["progress"] or job.progress
+        job.result = record["result"]
+        job.error = record["error"]
+        job.partial_results = dict(stages)
+        job._resumed = dict(stages)
+        return job
+
+    def on_stage(self, name, result, completed, total):
+        with self._lock:
+            self.partial_results[name] = result
+            self.progress["stage"] = name
+            self.progress["completed"] = completed if completed is not None else self.progress["completed"] + 1
+            if total is not None:
+                self.progress["total"] = total
+        if self.store is not None:
+            # Only stages that succeeded are worth skipping when the job resumes;
+            # errors, including tools killed at shutdown, run again.
+            if is_cacheable(result) and not self.token.cancelled:
+                self.store.save_stage(self.id, name, result)
+            self.save()
+
+    def resumed_stages(self):
+        return self._resumed
+
+    def save(self):
+        if self.store is None:
+            return
+        with self._lock:
+            record = {
+                "id": self.id,
+                "route": self.route,
+                "params": self.params,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error
+            }
+        self.store.save_job(record)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            job = {
+                "id": self.id,
+                "route": self.route,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "progress": dict(self.progress)
+            }
+            if include_result:
+                if self.done and self.status != JOB_CANCELLED:
+                    job["result"] = self.result
+                else:
+                    job["partial_results"] = dict(self.partial_results)
+                if self.error:
+                    job["error"] = self.error
+            return job
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their state for polling."""
+
+    def __init__(self, runner: Callable[[str, Dict[str, Any]], Any], max_workers: int = 4, max_finished: int = 500,
+                 store: Optional[JobStore] = None):
+        self.runner = runner
+        self.store = store
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, route: str, params: Dict[str, Any]) -> Job:
+        job = Job(route, params, self.store)
+        job.save()
+        self._enqueue(job)
+        logger.info(f"Job {job.id} queued for {route}")
+        return job
+
+    def restore(self) -> int:
+        """
+        Reload jobs from the store. Jobs that were queued or running when the
+        server stopped are queued again and skip the stages they already finished.
+        """
+        if self.store is None:
+            return 0
+        resumed = 0
+        self.store.prune_jobs(FINISHED_STATUSES, self.max_finished)
+        for record in self.store.load_jobs():
+            stages = {}
+            if record["status"] in (JOB_QUEUED, JOB_RUNNING):
+                stages = {name: result for name, result in self.store.load_stages(record["id"]).items()
+                          if is_cacheable(result)}
+            job = Job.from_record(record, stages, self.store)
+            if job.done:
+                with self._lock:
+                    self._jobs[job.id] = job
+                continue
+            job.status = JOB_QUEUED
+            job.progress["completed"] = 0
+            job.save()
+            self._enqueue(job)
+            resumed += 1
+            logger.info(f"Job {job.id} resumed with {len(stages)} completed stages")
+        with self._lock:
+            self._evict_finished()
+        return resumed
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            record = self.store.load_job(job_id)
+            if record is not None:
+                job = Job.from_record(record, {}, self.store)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued or running job: its subprocesses are killed and its
+        remaining stages dropped. Returns the job, or None if it is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self.get(job_id)
+        if job.done:
+            return job
+        job.token.cancel()
+        if job.future is not None and job.future.cancel():
+            # It never started, so _run will not record the cancellation.
+            self._finish_cancelled(job)
+        logger.info(f"Job {job.id} cancelled")
+        return job
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def stats(self) -> Dict[str, int]:
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0, JOB_CANCELLED: 0}
+        for job in self.list():
+            counts[job.status] += 1
+        counts["max_workers"] = self.max_workers
+        return counts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _enqueue(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        job.future = self._executor.submit(self._run, job)
+
+    def _run(self, job: Job):
+        if job.token.cancelled:
+            self._finish_cancelled(job)
+            return
+        job.status = JOB_RUNNING
+        job.started = job.started or time.time()
+        job.save()
+        try:
+            with progress.listen(job), progress.cancellable(job.token):
+                job.result = self.runner(job.route, job.params)
+            # Killed tools can make a scan return an error result rather than raise.
+            if job.token.cancelled:
+                job.result = None
+                job.status = JOB_CANCELLED
+            else:
+                job.status = JOB_COMPLETED
+        except progress.Cancelled:
+            job.status = JOB_CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = JOB_CANCELLED if job.token.cancelled else JOB_FAILED
+        finally:
+            job.finished = time.time()
+            job.save()
+            if self.store is not None:
+                self.store.delete_stages(job.id)
+
+    def _finish_cancelled(self, job: Job):
+        job.status = JOB_CANCELLED
+        job.finished = time.time()
+        job.save()
+        if self.store is not None:
+            self.store.delete_stages(job.id)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+            if self.store is not None:
+                self.store.delete_job(job_id)
@@ -0,0 +1,104 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    route TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    progress TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+JOB_COLUMNS = ("id", "route", "params", "status", "created", "started", "finished", "progress", "result", "error")
+
+class JobStore:
+    """Persists jobs and their finished stages in a local SQLite database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def save_job(self, job: Dict[str, Any]):
+        row = dict(job)
+        for column in ("params", "progress", "result"):
+            row[column] = json.dumps(row.get(column), default=str)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                [row.get(column) for column in JOB_COLUMNS]
+            )
+
+    def save_stage(self, job_id: str, name: str, result: Any):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (job_id, name, result) VALUES (?, ?, ?)",
+                (job_id, name, json.dumps(result, default=str))
+            )
+
+    def load_stages(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, result FROM stages WHERE job_id = ?", (job_id,)).fetchall()
+        return {name: json.loads(result) for name, result in rows}
+
+    def load_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def load_jobs(self, statuses: List[str] = None) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        args = []
+        if statuses:
+            query += f" WHERE status IN ({', '.join('?' * len(statuses))})"
+            args = list(statuses)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created", args).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def delete_stages(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM stages WHERE job_id = ?", (job_id,))
+
+    def delete_job(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM stages WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def prune_jobs(self, statuses: List[str], keep: int):
+        """Delete all but the `keep` most recently created jobs in the given statuses, with their stages."""
+        placeholders = ', '.join('?' * len(statuses))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND id NOT IN "
+                f"(SELECT id FROM jobs WHERE status IN ({placeholders}) ORDER BY created DESC LIMIT ?)",
+                list(statuses) * 2 + [keep]
+            )
+            self._conn.execute("DELETE FROM stages WHERE job_id NOT IN (SELECT id FROM jobs)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _decode(self, row) -> Dict[str, Any]:
+        job = dict(zip(JOB_COLUMNS, row))
+        for column in ("params", "progress", "result"):
+            job[column] = json.loads(job[column]) if job[column] is not None else None
+        return job
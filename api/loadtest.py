@@ -0,0 +1,267 @@
+"""
+Load test for the HTTP API that needs no network and none of the scanning tools.
+
+`python loadtest.py` starts server.py in a subprocess with every `core` module
+replaced by deterministic stubs that sleep (scans) or burn CPU (crypto), drives
+it with a configurable number of concurrent keep-alive clients and request mix,
+and reports requests per second and latency percentiles overall and per route.
+Pass --url to load an already running server instead.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+# Set in the stubbed server process so that the CPU pool's spawned workers install the same stubs.
+STUB_ENV = "HH_LOADTEST_SCALE"
+
+# Simulated cost of the functions in each module: ("sleep", seconds) for network-bound
+# scans, ("cpu", PBKDF2 iterations) for crypto.
+PROFILES = {
+    "core.vulnerability": ("sleep", 0.05),
+    "core.network": ("sleep", 0.2),
+    "core.reconnaissance": ("sleep", 0.1),
+    "core.encryption": ("cpu", 50000),
+    "libwapiti": ("sleep", 0.5)
+}
+# Composite scans report this many stages, splitting their cost between them.
+STAGES = {"full_scan": 5, "comprehensive_network_scan": 10, "comprehensive_subdomain_enumeration": 6}
+# Records yielded by the stub of a streaming route such as iter_nmap_scan.
+RECORDS = 1000
+
+DEFAULT_MIX = "/vulnerability/xss=4,/recon/whois=2,/network/ssl-enum=2,/encryption/generate-hmac=2,/network/full-scan=1"
+
+def _spend(kind: str, amount: float):
+    if kind == "sleep":
+        time.sleep(amount)
+    else:
+        hashlib.pbkdf2_hmac("sha256", b"loadtest", b"salt", max(1, int(amount)))
+
+def _stub(name: str, kind: str, amount: float):
+    from core import progress
+
+    def stub(*args):
+        stages = STAGES.get(name)
+        if not stages:
+            _spend(kind, amount)
+            return {"stub": name, "args": list(args)}
+        results = {}
+        for index in range(stages):
+            _spend(kind, amount / stages)
+            results[f"stage{index}"] = {"stub": name}
+            progress.report_stage(f"stage{index}", results[f"stage{index}"], index + 1, stages)
+        return results
+    return stub
+
+def _records_stub(name: str, kind: str, amount: float):
+    def stub(*args):
+        _spend(kind, amount)
+        for index in range(RECORDS):
+            yield {"host": str(args[0]), "port": index, "protocol": "tcp", "state": "open", "name": name}
+    return stub
+
+def install_stubs(scale: float = 1.0):
+    """Replace the modules behind every route with stubs whose cost is scaled by `scale`."""
+    from routes import ROUTES
+
+    modules = {}
+    for route in ROUTES.values():
+        kind, amount = PROFILES.get(route.module, ("sleep", 0.05))
+        amount *= scale
+        module = modules.get(route.module)
+        if module is None:
+            module = modules[route.module] = types.ModuleType(route.module)
+            sys.modules[route.module] = module
+        if callable(route.func):
+            # Routes like libwapiti's call into a class; stub the one they use.
+            scanner = _stub("WapitiScanner.scan", kind, amount)
+            module.WapitiScanner = type("WapitiScanner", (), {"__init__": lambda self, url: None,
+                                                               "scan": lambda self: scanner()})
+        else:
+            setattr(module, route.func, _stub(route.func, kind, amount))
+        if route.records:
+            setattr(module, route.records, _records_stub(route.records, kind, amount))
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        if part.strip():
+            path, _, weight = part.partition("=")
+            mix.append((path.strip(), float(weight or 1)))
+    return mix
+
+def request_body(path: str, index: int, targets: int) -> Dict[str, str]:
+    """Parameters for a request; `targets` distinct values control how often the cache can hit."""
+    from routes import get_route
+
+    route = get_route(path)
+    value = f"10.0.{index % targets // 256}.{index % targets % 256}"
+    body = {}
+    for name in route.params if route else ():
+        if name == "url":
+            body[name] = f"http://{value}/"
+        elif name in ("port", "key_size", "iterations"):
+            body[name] = None
+        else:
+            body[name] = value
+    return body
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+def _client(address, mix, deadline, max_requests, counter, targets, seed, samples, statuses, lock):
+    rng = random.Random(seed)
+    paths, weights = zip(*mix)
+    connection = http.client.HTTPConnection(*address, timeout=120)
+    while time.perf_counter() < deadline:
+        with lock:
+            if max_requests and counter[0] >= max_requests:
+                break
+            counter[0] += 1
+            index = counter[0]
+        path = rng.choices(paths, weights)[0]
+        body = json.dumps(request_body(path, index, targets))
+        start = time.perf_counter()
+        try:
+            connection.request("POST", path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(*address, timeout=120)
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples[path].append(elapsed)
+            statuses[status] += 1
+    connection.close()
+
+def drive(address, mix, concurrency: int, duration: float, max_requests: int = 0, targets: int = 1000) -> Dict:
+    samples, statuses, lock, counter = defaultdict(list), Counter(), threading.Lock(), [0]
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_client, args=(address, mix, deadline, max_requests, counter, targets, seed,
+                                                      samples, statuses, lock), daemon=True)
+               for seed in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    every = [value for values in samples.values() for value in values]
+
+    def summary(values):
+        return {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(max(values, default=0) * 1000, 1)
+        }
+    return {
+        "seconds": round(elapsed, 2),
+        "concurrency": concurrency,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "total": summary(every),
+        "routes": {path: summary(values) for path, values in sorted(samples.items())}
+    }
+
+def print_report(report: Dict):
+    print(f"{report['total']['requests']} requests in {report['seconds']} s with {report['concurrency']} clients, "
+          f"statuses {report['statuses']}")
+    print(f"{'route':40} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, row in list(report["routes"].items()) + [("total", report["total"])]:
+        print(f"{name:40} {row['requests']:>9} {row['rps']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['max_ms']:>8}")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int, scale: float, server_args: List[str]) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(port),
+                                "--scale", str(scale)] + server_args, cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("Stubbed server exited during startup")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Stubbed server did not start listening")
+
+def serve(argv: List[str]):
+    parser = argparse.ArgumentParser(description="Run server.py with stubbed core modules")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--scale", type=float, default=1.0)
+    args, server_args = parser.parse_known_args(argv)
+    os.environ[STUB_ENV] = str(args.scale)
+    install_stubs(args.scale)
+    # This module stays the main module, so the CPU pool's spawned workers re-import it and get the stubs.
+    import server
+    server.main(["--host", "127.0.0.1", "--port", str(args.port)] + server_args)
+
+if os.getenv(STUB_ENV) and __name__ != "__main__":
+    # Spawned CPU-pool workers import this module as __mp_main__; give them the stubs too.
+    install_stubs(float(os.environ[STUB_ENV]))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2:])
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Load test the HackerHelper API with stubbed scans",
+                                     epilog="Unrecognised options (e.g. --workers 16 --admission light=64:256) "
+                                            "are passed to server.py")
+    parser.add_argument("--url", help="Load an already running server instead of starting a stubbed one")
+    parser.add_argument("--concurrency", "-c", type=int, default=16, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", "-d", type=float, default=10, help="Seconds to run for")
+    parser.add_argument("--requests", "-n", type=int, default=0, help="Stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted routes as path=weight,...")
+    parser.add_argument("--targets", type=int, default=1000,
+                        help="Distinct targets to spread requests over; lower values raise cache and coalescing hits")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the simulated cost of every stub")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args, server_args = parser.parse_known_args()
+
+    process = None
+    if args.url:
+        url = urlparse(args.url)
+        address = (url.hostname, url.port or 80)
+    else:
+        address = ("127.0.0.1", _free_port())
+        process = start_server(address[1], args.scale, server_args)
+    try:
+        report = drive(address, parse_mix(args.mix), args.concurrency, args.duration, args.requests, args.targets)
+    finally:
+        if process is not None:
+            # SIGINT lets server.py close its pools cleanly.
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,134 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from core import telemetry
+from routes import get_route
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# Paths served by the HTTP layer itself rather than by a core route.
+SERVER_PATHS = ("/status", "/metrics", "/jobs", "/batch")
+
+def route_label(path: str) -> str:
+    """Collapse a request path into a bounded set of label values."""
+    if path in SERVER_PATHS or get_route(path) is not None:
+        return path
+    if path.startswith("/jobs/"):
+        return "/jobs/{id}"
+    return "unmatched"
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._values = defaultdict(dict)
+        telemetry.add_observer(self.observe_tool)
+
+    def close(self):
+        """Stop recording external tool runs."""
+        telemetry.remove_observer(self.observe_tool)
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Dict[str, str] = None, amount: float = 1):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] = None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._values[name]
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def request_started(self, route: str):
+        self.inc("hh_http_requests_in_flight", {"route": route})
+
+    def request_finished(self, route: str, method: str, status: int, seconds: float, bytes_in: int, bytes_out: int):
+        self.inc("hh_http_requests_in_flight", {"route": route}, -1)
+        self.inc("hh_http_requests_total", {"route": route, "method": method, "status": str(status)})
+        if status >= 500:
+            self.inc("hh_http_request_errors_total", {"route": route})
+        self.observe("hh_http_request_duration_seconds", seconds, {"route": route})
+        self.inc("hh_http_request_bytes_total", {"route": route}, bytes_in)
+        self.inc("hh_http_response_bytes_total", {"route": route}, bytes_out)
+
+    def observe_tool(self, tool: str, seconds: float, failed: bool):
+        self.inc("hh_tool_runs_total", {"tool": tool})
+        if failed:
+            self.inc("hh_tool_errors_total", {"tool": tool})
+        self.observe("hh_tool_duration_seconds", seconds, {"tool": tool})
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._values):
+                kind = self._types.get(name, "untyped")
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if isinstance(value, Histogram):
+                        for bound, count in zip(value.buckets, value.counts):
+                            labels = _format_labels(key + (("le", _format_value(bound)),))
+                            lines.append(f"{name}_bucket{labels} {count}")
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {value.count}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value.sum)}")
+                        lines.append(f"{name}_count{_format_labels(key)} {value.count}")
+                    else:
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def create_registry() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.describe("hh_http_requests_total", "counter", "HTTP requests handled, by route, method and status.")
+    registry.describe("hh_http_request_errors_total", "counter", "HTTP requests that ended with a 5xx status.")
+    registry.describe("hh_http_requests_in_flight", "gauge", "HTTP requests currently being handled.")
+    registry.describe("hh_http_request_duration_seconds", "histogram", "Time spent handling HTTP requests.")
+    registry.describe("hh_http_request_bytes_total", "counter", "Request body bytes received.")
+    registry.describe("hh_http_response_bytes_total", "counter", "Response bytes sent, including headers.")
+    registry.describe("hh_tool_runs_total", "counter", "External tool invocations, such as nmap or amass.")
+    registry.describe("hh_tool_errors_total", "counter", "External tool invocations that raised an error.")
+    registry.describe("hh_tool_duration_seconds", "histogram", "Wall-clock time of external tool invocations.")
+    return registry
@@ -0,0 +1,155 @@
+import logging
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+from core import progress
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CPU_WORKERS = os.cpu_count() or 1
+DEFAULT_TIMEOUT = 30
+
+class OperationTimeout(TimeoutError):
+    pass
+
+def _run_route(path: str, data: Dict[str, Any]) -> Any:
+    # Runs in the worker process, which imports the route's module on first use.
+    import routes
+    return routes.dispatch(path, data)
+
+class CpuPool:
+    """
+    Runs CPU-bound routes in a pool of worker processes so they neither hold the
+    GIL on the request threads nor stop at one core.
+
+    Operations wait for a free worker before they are submitted, so their
+    timeout counts only the time they run, not the time spent queued behind
+    others. An operation that exceeds its timeout cannot be interrupted inside
+    a worker, so the whole pool is replaced; operations that were running in
+    it are retried once on the new pool.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_CPU_WORKERS, default_timeout: float = DEFAULT_TIMEOUT):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        # Worker processes are spawned rather than forked from the multithreaded server.
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._generation = 0
+        self._slots = threading.Condition()
+        self._running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.recycled = 0
+
+    def run(self, path: str, data: Dict[str, Any], timeout: float = None) -> Any:
+        timeout = timeout or self.default_timeout
+        with self._slot():
+            return self._submit(path, data, timeout)
+
+    def _submit(self, path: str, data: Dict[str, Any], timeout: float) -> Any:
+        for attempt in range(2):
+            with self._lock:
+                executor, generation = self._executor, self._generation
+            future = executor.submit(_run_route, path, data)
+            unregister = progress.on_cancel(future.cancel)
+            try:
+                result = future.result(timeout)
+            except FutureTimeout:
+                self._recycle(generation)
+                with self._lock:
+                    self.timeouts += 1
+                raise OperationTimeout(f"{path} did not finish within {timeout} seconds")
+            except CancelledError:
+                progress.check_cancelled()
+                raise
+            except BrokenProcessPool:
+                # Another operation's timeout replaced the pool under this one.
+                if attempt or generation == self._generation:
+                    raise
+                continue
+            finally:
+                unregister()
+            with self._lock:
+                self.completed += 1
+            return result
+
+    @contextmanager
+    def _slot(self):
+        """Hold one of the pool's max_workers slots for the duration of the block."""
+        with self._slots:
+            if self._running >= self.max_workers:
+                self.waiting += 1
+                # A cancelled caller wakes the queue so that it can leave it.
+                unregister = progress.on_cancel(self._wake)
+                try:
+                    while self._running >= self.max_workers:
+                        progress.check_cancelled()
+                        self._slots.wait()
+                    progress.check_cancelled()
+                except progress.Cancelled:
+                    # Pass on a wake-up this caller may have consumed.
+                    self._slots.notify()
+                    raise
+                finally:
+                    self.waiting -= 1
+                    unregister()
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._slots:
+                self._running -= 1
+                self._slots.notify()
+
+    def _wake(self):
+        with self._slots:
+            self._slots.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._slots:
+            running, waiting = self._running, self.waiting
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": running,
+                "waiting": waiting,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+        self._terminate(executor)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def _recycle(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            old = self._executor
+            self._executor = self._new_executor()
+            self._generation += 1
+            self.recycled += 1
+        logger.warning("Replacing the CPU worker pool after an operation timed out")
+        self._terminate(old)
+
+    def _terminate(self, executor: ProcessPoolExecutor):
+        # ProcessPoolExecutor has no public way to stop a running task, so the
+        # worker processes are terminated directly.
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
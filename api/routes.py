@@ -0,0 +1,170 @@
+import importlib
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Union
+
+from admission import HEAVY, LIGHT, STANDARD
+
+class RouteNotFound(LookupError):
+    pass
+
+# Seconds spent importing each module the first time one of its routes was hit.
+IMPORT_TIMES = {}
+_import_locks = {}
+_lock = threading.Lock()
+
+def load_module(name: str):
+    """Import a module on first use and record how long the import took."""
+    if name in IMPORT_TIMES:
+        return sys.modules[name]
+    with _lock:
+        module_lock = _import_locks.setdefault(name, threading.Lock())
+    with module_lock:
+        if name not in IMPORT_TIMES:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            IMPORT_TIMES[name] = time.perf_counter() - start
+    return sys.modules[name]
+
+def import_report() -> Dict[str, float]:
+    return dict(IMPORT_TIMES)
+
+class Route:
+    """
+    Maps an API path to a function in a lazily imported module.
+
+    `func` is either the name of a function in `module`, or a callable that
+    receives the imported module followed by the request parameters.
+    Identical concurrent requests to a `coalesce` route share one execution;
+    it defaults to on for background (scan) routes. `route_class` selects the
+    admission limits the route runs under; background routes default to
+    "standard" and the rest to "light". `cpu_bound` routes run in the server's
+    worker process pool and fail after `timeout` seconds. `records` names a
+    generator in `module` that yields the same result one record at a time;
+    direct requests that run in-process use it to stream large results.
+    `remote` routes are handed to scan workers when the server runs with a
+    broker; this defaults to on for background routes.
+    """
+
+    def __init__(self, path: str, module: str, func: Union[str, Callable[..., Any]],
+                 params: Iterable[str] = (), background: bool = False, cache_ttl: Optional[float] = None,
+                 coalesce: Optional[bool] = None, route_class: Optional[str] = None, cpu_bound: bool = False,
+                 timeout: Optional[float] = None, records: Optional[str] = None, remote: Optional[bool] = None):
+        self.path = path
+        self.module = module
+        self.func = func
+        self.params = tuple(params)
+        self.background = background
+        self.cache_ttl = cache_ttl
+        self.coalesce = background if coalesce is None else coalesce
+        self.route_class = route_class or (STANDARD if background else LIGHT)
+        self.cpu_bound = cpu_bound
+        self.timeout = timeout
+        self.records = records
+        self.remote = background if remote is None else remote
+
+    def resolve(self) -> Callable[..., Any]:
+        module = load_module(self.module)
+        if callable(self.func):
+            return lambda *args: self.func(module, *args)
+        return getattr(module, self.func)
+
+    def arguments(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: data.get(name) for name in self.params}
+
+    def __call__(self, data: Dict[str, Any]) -> Any:
+        return self.resolve()(*[data.get(name) for name in self.params])
+
+    def iter_records(self, data: Dict[str, Any]) -> Iterator[Any]:
+        return iter(getattr(load_module(self.module), self.records)(*[data.get(name) for name in self.params]))
+
+ROUTES = {}
+
+HOUR = 60 * 60
+
+def route(path: str, module: str, func: Union[str, Callable[..., Any]], params: Iterable[str] = (),
+          background: bool = False, cache_ttl: Optional[float] = None, coalesce: Optional[bool] = None,
+          route_class: Optional[str] = None, cpu_bound: bool = False, timeout: Optional[float] = None,
+          records: Optional[str] = None, remote: Optional[bool] = None) -> Route:
+    ROUTES[path] = Route(path, module, func, params, background, cache_ttl, coalesce, route_class, cpu_bound, timeout,
+                         records, remote)
+    return ROUTES[path]
+
+def get_route(path: str) -> Optional[Route]:
+    return ROUTES.get(path)
+
+def dispatch(path: str, data: Dict[str, Any]) -> Any:
+    handler = ROUTES.get(path)
+    if handler is None:
+        raise RouteNotFound(path)
+    return handler(data)
+
+def preload(modules: Iterable[str]) -> Dict[str, float]:
+    """Import the given modules up front, e.g. `core.network`, and return their import cost."""
+    for name in modules:
+        load_module(name)
+    return import_report()
+
+def route_modules() -> Iterable[str]:
+    return sorted({handler.module for handler in ROUTES.values()})
+
+route('/vulnerability/xss', 'core.vulnerability', 'xss_check', ['url'], remote=True)
+route('/vulnerability/csrf', 'core.vulnerability', 'csrf_token_check', ['url'], remote=True)
+route('/vulnerability/clickjacking', 'core.vulnerability', 'clickjacking_check', ['url'], remote=True)
+route('/vulnerability/sql-injection', 'core.vulnerability', 'sql_injection_check', ['url'], remote=True)
+route('/vulnerability/ssl-tls', 'core.vulnerability', 'ssl_tls_check', ['url'], cache_ttl=HOUR, remote=True)
+route('/vulnerability/fully-vuln-scan', 'libwapiti', lambda libwapiti, url: libwapiti.WapitiScanner(url).scan(), ['url'],
+      background=True, route_class=HEAVY)
+
+route('/network/http-enum', 'core.network', 'http_enum', ['target'], background=True)
+route('/network/ssl-enum', 'core.network', 'ssl_enum', ['target', 'port'], background=True, cache_ttl=HOUR)
+route('/network/dns-brute', 'core.network', 'dns_brute', ['domain'], background=True)
+route('/network/smb-enum', 'core.network', 'smb_enum', ['target'], background=True)
+route('/network/mysql-enum', 'core.network', 'mysql_enum', ['target', 'port'], background=True)
+route('/network/nmap-scan', 'core.network', 'nmap_scan', ['target', 'scan_types', 'ports', 'arguments'], background=True,
+      route_class=HEAVY, records='iter_nmap_scan')
+route('/network/ping-sweep', 'core.network', 'ping_sweep', ['targets', 'count', 'timeout'], background=True)
+route('/network/tcp-ping-sweep', 'core.network', 'tcp_ping_sweep', ['targets', 'port', 'count', 'timeout'],
+      background=True)
+route('/network/traceroute-map', 'core.network', 'traceroute_map', ['targets', 'max_hops', 'timeout', 'format'],
+      background=True)
+route('/network/port-scan', 'core.portscan', 'port_scan', ['targets', 'ports', 'concurrency', 'per_host', 'timeout'],
+      background=True, route_class=HEAVY, records='iter_port_scan')
+route('/network/nmap-sweep', 'core.network', 'nmap_scan_sharded', ['target', 'scan_types', 'ports', 'arguments', 'workers'],
+      background=True, route_class=HEAVY, records='iter_nmap_scan_sharded')
+route('/network/full-scan', 'core.network', 'full_scan', ['target'], background=True, route_class=HEAVY)
+route('/network/comprehensive-scan', 'core.network', 'comprehensive_network_scan', ['target'], background=True,
+      route_class=HEAVY)
+
+route('/encryption/generate-key-pair-ecdsa', 'core.encryption', 'generate_key_pair_ecdsa', cpu_bound=True, timeout=10)
+route('/encryption/sign-ecdsa', 'core.encryption', 'sign_ecdsa', ['private_key', 'message'], cpu_bound=True, timeout=10)
+route('/encryption/verify-ecdsa', 'core.encryption', 'verify_ecdsa', ['public_key', 'message', 'signature'],
+      cpu_bound=True, timeout=10)
+route('/encryption/encrypt-file', 'core.encryption', 'encrypt_file', ['file_path', 'key'], cpu_bound=True, timeout=60)
+route('/encryption/decrypt-file', 'core.encryption', 'decrypt_file', ['file_path', 'key'], cpu_bound=True, timeout=60)
+route('/encryption/generate-key-pair-ecdh', 'core.encryption', 'generate_key_pair_ecdh', cpu_bound=True, timeout=10)
+route('/encryption/generate-key-pair-rsa', 'core.encryption', 'generate_key_pair_rsa', ['key_size'], cpu_bound=True,
+      timeout=60)
+route('/encryption/generate-key-pair-dsa', 'core.encryption', 'generate_key_pair_dsa', ['key_size'], cpu_bound=True,
+      timeout=60)
+route('/encryption/derive-key', 'core.encryption', 'derive_key', ['password', 'salt', 'iterations'], cpu_bound=True,
+      timeout=30)
+route('/encryption/generate-hmac', 'core.encryption', 'generate_hmac', ['key', 'message'])
+route('/encryption/verify-hmac', 'core.encryption', 'verify_hmac', ['key', 'message', 'hmac'])
+route('/encryption/generate-totp', 'core.encryption', 'generate_totp', ['secret'])
+route('/encryption/verify-totp', 'core.encryption', 'verify_totp', ['secret', 'token'])
+
+route('/recon/whois', 'core.reconnaissance', 'advanced_whois_lookup', ['domain'], background=True,
+      cache_ttl=6 * HOUR)
+route('/recon/shodan', 'core.reconnaissance', 'comprehensive_shodan_search', ['query'], background=True)
+route('/recon/censys', 'core.reconnaissance', 'multi_source_censys_search', ['query'], background=True)
+route('/recon/google-dork', 'core.reconnaissance', 'advanced_google_dork_search', ['domain', 'dorks'], background=True)
+route('/recon/technology-detection', 'core.reconnaissance', 'comprehensive_technology_detection', ['url'],
+      background=True)
+route('/recon/email-harvest', 'core.reconnaissance', 'advanced_email_harvesting', ['domain'], background=True)
+route('/recon/domain-info', 'core.reconnaissance', 'comprehensive_domain_info', ['domain'], background=True,
+      cache_ttl=6 * HOUR)
+route('/recon/ssl-info', 'core.reconnaissance', 'advanced_ssl_info', ['domain'], background=True, cache_ttl=HOUR)
+route('/recon/subdomain-enum', 'core.reconnaissance', 'comprehensive_subdomain_enumeration', ['domain'],
+      background=True, route_class=HEAVY)
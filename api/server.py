@@ -1,219 +1,522 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import urlparse, parse_qs
-from core import vulnerability, network, encryption, reconnaissance
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from admission import AdmissionController, Overloaded, parse_limits
+from batch import BatchError, batch_limits, expand_items, run_batch
+from broker import Broker, NoWorkers, is_loopback, parse_address
+from cache import DEFAULT_DISK_MAX_BYTES, DEFAULT_MAX_BYTES, ResultCache, cache_key, is_cacheable, parse_cache_control
+from core import progress, tracing
+from disconnect import DisconnectWatcher
+from jobs import JobManager, JOB_CANCELLED
+from jobstore import JobStore
+from routes import RouteNotFound, get_route, import_report, preload, route_modules
+from singleflight import SingleFlight
+from streaming import StreamWriter, negotiate_stream_format, CONTENT_TYPES
+from offload import DEFAULT_CPU_WORKERS, CpuPool, OperationTimeout
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, create_registry, route_label
+from transport import (CHUNK_SIZE, CHUNK_THRESHOLD, MIN_COMPRESS_SIZE, CountingWriter, ResponseBody, compress, json_chunks,
+                       negotiate_encoding)
+import argparse
+import itertools
 import json
+import os
+import threading
+import time
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_JOB_WORKERS = 4
+KEEP_ALIVE_TIMEOUT = 15
+# Recorded for requests abandoned because the client went away (nginx uses the same code).
+CLIENT_CLOSED_REQUEST = 499
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands every connection to a bounded pool of worker threads."""
+
+    def __init__(self, server_address, handler_class, max_workers: int = DEFAULT_WORKERS,
+                 job_workers: int = DEFAULT_JOB_WORKERS, cache: ResultCache = None, job_store: JobStore = None,
+                 admission: AdmissionController = None, cpu_workers: int = DEFAULT_CPU_WORKERS, broker: Broker = None):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self.cache = cache or ResultCache()
+        self.metrics = create_registry()
+        self.flights = SingleFlight()
+        self.admission = admission or AdmissionController()
+        self.disconnects = DisconnectWatcher()
+        self.cpu_pool = CpuPool(cpu_workers)
+        self.broker = broker
+        # Jobs and batch items already run on bounded pools, so they wait for room
+        # in the admission queue instead of being rejected; requests that would
+        # start them get 429 up front instead (see MyServer._check_capacity).
+        self.jobs = JobManager(lambda route, params: self.execute(route, params, wait=True),
+                               max_workers=job_workers, store=job_store)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-worker')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        # An idle keep-alive connection blocks a worker until KEEP_ALIVE_TIMEOUT, so only
+        # this many may stay open between requests; a quarter of the workers stay free.
+        self.max_keep_alive = max_workers - max(1, max_workers // 4)
+        self._keep_alive = 0
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self._queued += 1
+        self._executor.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._active -= 1
+
+    def acquire_keep_alive(self) -> bool:
+        with self._lock:
+            if self._keep_alive >= self.max_keep_alive:
+                return False
+            self._keep_alive += 1
+            return True
+
+    def release_keep_alive(self):
+        with self._lock:
+            self._keep_alive -= 1
+
+    def execute(self, path: str, data: dict, cache_control: str = None, wait: bool = False):
+        handler = get_route(path)
+        if handler is None:
+            raise RouteNotFound(path)
+        # Only the call that actually runs the route takes an admission slot;
+        # cache hits and coalesced callers add no load.
+        run = lambda: self._admitted(handler, data, wait)
+        if data.get('_trace'):
+            # A traced request always runs the route itself, so the trace describes this run.
+            with tracing.trace() as recording:
+                with tracing.span(path, "request"):
+                    result = self._checked(run)
+            return tracing.attach(result, recording)
+
+        key = cache_key(path, handler.arguments(data))
+        if handler.coalesce:
+            call = lambda: self.flights.do(key, run)
+        else:
+            call = run
+        if handler.cache_ttl is None:
+            return self._checked(call)
+
+        read, write = parse_cache_control(cache_control)
+        if read:
+            try:
+                return self.cache.get(key)
+            except KeyError:
+                pass
+        else:
+            self.cache.record_bypass()
+        result = self._checked(call)
+        if write and is_cacheable(result):
+            self.cache.set(key, result, handler.cache_ttl)
+        return result
+
+    def _checked(self, call):
+        # Tools killed by a cancellation can make a scan return an error result
+        # instead of raising; that result must not be cached or delivered.
+        result = call()
+        progress.check_cancelled()
+        return result
+
+    def _admitted(self, handler, data: dict, wait: bool):
+        with self.admission.admit(handler.route_class, wait):
+            if handler.cpu_bound:
+                return self.cpu_pool.run(handler.path, data, handler.timeout)
+            if handler.remote and self.broker is not None:
+                return self.broker.run(handler.path, data)
+            return handler(data)
+
+    def pool_status(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "keep_alive": self._keep_alive,
+                "max_keep_alive": self.max_keep_alive
+            }
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.jobs.shutdown()
+        self.disconnects.close()
+        self.cpu_pool.shutdown()
+        self.metrics.close()
+        if self.broker is not None:
+            self.broker.close()
 
 class MyServer(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections are dropped after this many seconds so they
+    # do not hold on to a worker thread.
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle(self):
+        self._keep_alive = self.server.acquire_keep_alive()
+        try:
+            super().handle()
+        finally:
+            if self._keep_alive:
+                self.server.release_keep_alive()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+        if not self._keep_alive:
+            # Every keep-alive slot is taken, so close after the response and free the worker.
+            self.send_header('Connection', 'close')
+
+    def do_GET(self):
+        self._instrumented('GET', self._handle_get)
+
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
+        self._instrumented('POST', self._handle_post)
+
+    def do_DELETE(self):
+        self._instrumented('DELETE', self._handle_delete)
+
+    def _instrumented(self, method: str, handler):
+        route = route_label(urlparse(self.path).path)
+        metrics = self.server.metrics
+        self._status = 0
+        self._bytes_in = 0
+        bytes_out = self.wfile.count
+        start = time.perf_counter()
+        metrics.request_started(route)
+        try:
+            handler()
+        finally:
+            metrics.request_finished(route, method, self._status, time.perf_counter() - start,
+                                     self._bytes_in, self.wfile.count - bytes_out)
+
+    def _handle_get(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            self._send_body(200, self.server.metrics.render().encode(), METRICS_CONTENT_TYPE)
+        elif path == '/status':
+            self._send_json(200, {
+                "pool": self.server.pool_status(),
+                "jobs": self.server.jobs.stats(),
+                "cache": self.server.cache.stats(),
+                "coalescing": self.server.flights.stats(),
+                "admission": self.server.admission.stats(),
+                "cpu_pool": self.server.cpu_pool.stats(),
+                "broker": self.server.broker.stats() if self.server.broker else None,
+                "imports": import_report()
+            })
+        elif path == '/jobs':
+            self._send_json(200, [job.to_dict(include_result=False) for job in self.server.jobs.list()])
+        elif path.startswith('/jobs/') and path.endswith('/trace'):
+            job = self.server.jobs.get(path[len('/jobs/'):-len('/trace')])
+            summary = tracing.trace_summary(job.result) if job is not None else None
+            if summary is None:
+                self._send_json(404, {"error": "No trace for this job; submit it with \"_trace\": true"})
+            else:
+                self._send_json(200, tracing.to_chrome(summary))
+        elif path.startswith('/jobs/'):
+            job = self.server.jobs.get(path[len('/jobs/'):])
+            if job is None:
+                self._send_json(404, {"error": "Unknown job"})
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {"error": f"Unknown route: {path}"})
+
+    def _handle_post(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
         post_data = self.rfile.read(content_length)
-        data = json.loads(post_data)
-
-        if self.path == '/vulnerability/xss':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(vulnerability.xss_check(url).encode())
-
-        elif self.path == '/vulnerability/csrf':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(vulnerability.csrf_token_check(url).encode())
-
-        elif self.path == '/vulnerability/clickjacking':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(vulnerability.clickjacking_check(url).encode())
-
-        elif self.path == '/vulnerability/sql-injection':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(vulnerability.sql_injection_check(url).encode())
-
-        elif self.path == '/vulnerability/ssl-tls':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(vulnerability.ssl_tls_check(url).encode())
-
-        elif self.path == '/vulnerability/fully-vuln-scan':
-            url = data.get('url')
-            scanner = libwapiti.WapitiScanner(url)
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(scanner.scan().encode())
-
-        elif self.path == '/network/http-enum':
-            target = data.get('target')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.http_enum(target).encode())
-
-        elif self.path == '/network/ssl-enum':
-            target = data.get('target')
-            port = data.get('port')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.ssl_enum(target, port).encode())
-
-        elif self.path == '/network/dns-brute':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.dns_brute(domain).encode())
-
-        elif self.path == '/network/smb-enum':
-            target = data.get('target')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.smb_enum(target).encode())
-
-        elif self.path == '/network/mysql-enum':
-            target = data.get('target')
-            port = data.get('port')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.mysql_enum(target, port).encode())
-
-        elif self.path == '/network/nmap-scan':
-            target = data.get('target')
-            scan_types = data.get('scan_types')
-            ports = data.get('ports')
-            arguments = data.get('arguments')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(network.nmap_scan(target, scan_types, ports, arguments).encode())
-
-        elif self.path == '/encryption/generate-key-pair-ecdsa':
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.generate_key_pair_ecdsa().encode())
-
-        elif self.path == '/encryption/sign-ecdsa':
-            private_key = data.get('private_key')
-            message = data.get('message')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.sign_ecdsa(private_key, message).encode())
-
-        elif self.path == '/encryption/verify-ecdsa':
-            public_key = data.get('public_key')
-            message = data.get('message')
-            signature = data.get('signature')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.verify_ecdsa(public_key, message, signature).encode())
-
-        elif self.path == '/encryption/encrypt-file':
-            file_path = data.get('file_path')
-            key = data.get('key')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.encrypt_file(file_path, key).encode())
-
-        elif self.path == '/encryption/decrypt-file':
-            file_path = data.get('file_path')
-            key = data.get('key')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.decrypt_file(file_path, key).encode())
-
-        elif self.path == '/encryption/generate-key-pair-ecdh':
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.generate_key_pair_ecdh().encode())
-
-        elif self.path == '/encryption/generate-hmac':
-            key = data.get('key')
-            message = data.get('message')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.generate_hmac(key, message).encode())
-
-        elif self.path == '/encryption/verify-hmac':
-            key = data.get('key')
-            message = data.get('message')
-            hmac = data.get('hmac')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.verify_hmac(key, message, hmac).encode())
-
-        elif self.path == '/encryption/generate-totp':
-            secret = data.get('secret')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.generate_totp(secret).encode())
-
-        elif self.path == '/encryption/verify-totp':
-            secret = data.get('secret')
-            token = data.get('token')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(encryption.verify_totp(secret, token).encode())
-
-        elif self.path == '/recon/whois':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.advanced_whois_lookup(domain).encode())
-
-        elif self.path == '/recon/shodan':
-            query = data.get('query')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.comprehensive_shodan_search(query).encode())
-
-        elif self.path == '/recon/censys':
-            query = data.get('query')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.multi_source_censys_search(query).encode())
-
-        elif self.path == '/recon/google-dork':
-            domain = data.get('domain')
-            dorks = data.get('dorks')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.advanced_google_dork_search(domain, dorks).encode())
-
-        elif self.path == '/recon/technology-detection':
-            url = data.get('url')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.comprehensive_technology_detection(url).encode())
-
-        elif self.path == '/recon/email-harvest':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.advanced_email_harvesting(domain).encode())
-
-        elif self.path == '/recon/domain-info':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.comprehensive_domain_info(domain).encode())
-
-        elif self.path == '/recon/ssl-info':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.advanced_ssl_info(domain).encode())
-
-        elif self.path == '/recon/subdomain-enum':
-            domain = data.get('domain')
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(reconnaissance.comprehensive_subdomain_enumeration(domain).encode())
-
-def run():
+        self._bytes_in = len(post_data)
+        try:
+            data = json.loads(post_data) if post_data else {}
+        except ValueError:
+            self._send_json(400, {"error": "Request body is not valid JSON"})
+            return
+        if not isinstance(data, dict):
+            self._send_json(400, {"error": "Request body must be a JSON object"})
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        stream_format = negotiate_stream_format(self.headers.get('Accept'), query.get('stream', [None])[0])
+        trace_format = query.get('trace', [None])[0]
+        if trace_format and trace_format.lower() not in ('0', 'false', 'no'):
+            data['_trace'] = True
+
+        if url.path == '/jobs':
+            self._submit_job(data.get('route'), data.get('params') or {})
+        elif url.path == '/batch':
+            self._run_batch(data, stream_format)
+        elif query.get('async', ['0'])[0].lower() in ('1', 'true', 'yes'):
+            self._submit_job(url.path, data)
+        elif stream_format:
+            self._stream(url.path, data, stream_format)
+        elif self._streams_records(get_route(url.path), data):
+            self._send_records(url.path, data)
+        else:
+            try:
+                with self._cancel_on_disconnect():
+                    result = self.server.execute(url.path, data, self.headers.get('Cache-Control'))
+                # execute() wraps traced results that are not objects as {"result": ..., "_trace": ...};
+                # a result without a usable summary is returned as it is.
+                summary = tracing.trace_summary(result)
+                if trace_format == 'chrome' and summary is not None:
+                    result = tracing.to_chrome(summary)
+                self._send_json(200, result)
+            except progress.Cancelled:
+                self._client_gone()
+            except RouteNotFound:
+                self._send_json(404, {"error": f"Unknown route: {url.path}"})
+            except Overloaded as e:
+                self._send_overloaded(e)
+            except OperationTimeout as e:
+                self._send_json(504, {"error": str(e)})
+            except NoWorkers as e:
+                self._send_json(503, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+    def _streams_records(self, handler, data: dict) -> bool:
+        # Remote routes go through the broker when there is one, which returns whole results.
+        return (handler is not None and handler.records is not None and not data.get('_trace')
+                and not (handler.remote and self.server.broker is not None))
+
+    def _handle_delete(self):
+        path = urlparse(self.path).path
+        if not path.startswith('/jobs/'):
+            self._send_json(404, {"error": f"Unknown route: {path}"})
+            return
+        job = self.server.jobs.cancel(path[len('/jobs/'):])
+        if job is None:
+            self._send_json(404, {"error": "Unknown job"})
+        elif job.done and job.status != JOB_CANCELLED:
+            self._send_json(409, {"error": f"Job already {job.status}", **job.to_dict(include_result=False)})
+        else:
+            # A running job stops asynchronously once its tools have been killed.
+            self._send_json(200 if job.done else 202, job.to_dict(include_result=False))
+
+    @contextmanager
+    def _cancel_on_disconnect(self):
+        """Cancel the scans run inside the block if the client closes the connection."""
+        token = progress.CancelToken()
+        unwatch = self.server.disconnects.watch(self.connection, token.cancel)
+        try:
+            with progress.cancellable(token):
+                yield token
+        finally:
+            unwatch()
+
+    def _client_gone(self):
+        self._status = CLIENT_CLOSED_REQUEST
+        self.close_connection = True
+
+    def _stream(self, path: str, data: dict, fmt: str):
+        # Reject up front while a plain status code can still be sent; a request
+        # that loses the race for the last queue slot gets an error event instead.
+        if not self._check_capacity([path]):
+            return
+        writer, body = self._start_stream(fmt)
+        try:
+            with progress.listen(writer), self._cancel_on_disconnect():
+                result = self.server.execute(path, data, self.headers.get('Cache-Control'))
+            writer.send("result", {"result": result})
+        except progress.Cancelled:
+            self._client_gone()
+            return
+        except RouteNotFound:
+            writer.send("error", {"error": f"Unknown route: {path}"})
+        except Overloaded as e:
+            writer.send("error", {"error": str(e), "retry_after": e.retry_after})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        except Exception as e:
+            writer.send("error", {"error": str(e)})
+        body.close()
+
+    def _send_records(self, path: str, data: dict):
+        """
+        Send a route's result as a JSON array encoded while its records are
+        generated, so memory use does not grow with the size of the result.
+        These responses bypass the result cache and request coalescing.
+        """
+        handler = get_route(path)
+        body = None
+        try:
+            with self._cancel_on_disconnect(), self.server.admission.admit(handler.route_class):
+                records = handler.iter_records(data)
+                # The scan runs up to its first record here, so failures still get a proper status.
+                first = next(records, None)
+                body = self._start_body(200, 'application/json')
+                for chunk in json_chunks(records if first is None else itertools.chain([first], records)):
+                    body.write(chunk)
+                body.close()
+        except progress.Cancelled:
+            self._client_gone()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            if body is None:
+                if isinstance(e, Overloaded):
+                    self._send_overloaded(e)
+                else:
+                    self._send_json(500, {"error": str(e)})
+            else:
+                # The status has been sent; an unterminated body tells the client the result is incomplete.
+                self.close_connection = True
+
+    def _run_batch(self, data: dict, stream_format: str = None):
+        try:
+            items = expand_items(data)
+            concurrency, per_host = batch_limits(data)
+        except BatchError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        if not self._check_capacity(item["route"] for item in items):
+            return
+        cache_control = self.headers.get('Cache-Control')
+        execute = lambda route, params: self.server.execute(route, params, cache_control, wait=True)
+
+        if stream_format:
+            writer, body = self._start_stream(stream_format)
+            try:
+                with self._cancel_on_disconnect():
+                    run_batch(items, execute, lambda item_id, outcome: writer.send("item", {"id": item_id, **outcome}),
+                              concurrency, per_host)
+                writer.send("done", {"items": len(items)})
+                body.close()
+            except progress.Cancelled:
+                self._client_gone()
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+        else:
+            results = {}
+            try:
+                with self._cancel_on_disconnect():
+                    run_batch(items, execute, results.__setitem__, concurrency, per_host)
+            except progress.Cancelled:
+                self._client_gone()
+                return
+            self._send_json(200, {"results": results})
+
+    def _submit_job(self, route: str, params: dict):
+        handler = get_route(route)
+        if handler is None or not handler.background:
+            self._send_json(400, {"error": f"Route cannot run as a job: {route}"})
+            return
+        if not self._check_capacity([route]):
+            return
+        job = self.server.jobs.submit(route, params)
+        self._send_json(202, job.to_dict(include_result=False), {'Location': f'/jobs/{job.id}'})
+
+    def _check_capacity(self, routes) -> bool:
+        """Send 429 and return False if the admission queue of any of the routes' classes is full."""
+        admission = self.server.admission
+        for route_class in {handler.route_class for handler in map(get_route, routes) if handler is not None}:
+            if not admission.has_capacity(route_class):
+                self._send_overloaded(Overloaded(route_class, admission.retry_after(route_class)))
+                return False
+        return True
+
+    def _send_overloaded(self, error: Overloaded):
+        self._send_json(429, {"error": str(error), "retry_after": error.retry_after},
+                        {'Retry-After': str(error.retry_after)})
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        self._send_body(status, json.dumps(payload, default=str).encode(), 'application/json', headers)
+
+    def _send_body(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        encoding = None
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            if encoding:
+                body = compress(body, encoding)
+        chunked = len(body) > CHUNK_THRESHOLD and self.request_version == 'HTTP/1.1'
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if chunked:
+            out = ResponseBody(self.wfile, chunked=True)
+            for offset in range(0, len(body), CHUNK_SIZE):
+                out.write(body[offset:offset + CHUNK_SIZE])
+            out.close()
+        else:
+            self.wfile.write(body)
+
+    def _start_stream(self, fmt: str):
+        """Send the headers of a streamed response and return its event writer and body."""
+        body = self._start_body(200, CONTENT_TYPES[fmt], {'Cache-Control': 'no-cache'})
+        return StreamWriter(body, fmt), body
+
+    def _start_body(self, status: int, content_type: str, headers: dict = None) -> ResponseBody:
+        """Send the headers of a response whose length is not known up front and return its body."""
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+        chunked = self.request_version == 'HTTP/1.1'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            # Without chunked encoding the end of the body is marked by closing the connection.
+            if not self.close_connection:
+                self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        return ResponseBody(self.wfile, encoding, chunked)
+
+def run(host: str = '', port: int = 3001, workers: int = DEFAULT_WORKERS, job_workers: int = DEFAULT_JOB_WORKERS,
+        preload_modules: list = None, cache_bytes: int = DEFAULT_MAX_BYTES, cache_dir: str = None, job_db: str = None,
+        admission_limits: str = None, cpu_workers: int = DEFAULT_CPU_WORKERS, broker_address: str = None,
+        broker_secret: str = None, cache_disk_bytes: int = DEFAULT_DISK_MAX_BYTES):
     print('Starting server...')
-    server_address = ('', 3001)
-    httpd = HTTPServer(server_address, MyServer)
-    print('Server is running...')
+    if preload_modules:
+        for module, seconds in preload(preload_modules).items():
+            print(f'  imported {module} in {seconds * 1000:.1f} ms')
+    server_address = (host, port)
+    broker = None
+    if broker_address:
+        broker = Broker(*parse_address(broker_address), secret=broker_secret)
+        print(f'Broker is listening on {broker.address[0]}:{broker.address[1]}; scans run on workers')
+    httpd = PooledHTTPServer(server_address, MyServer, max_workers=workers, job_workers=job_workers,
+                             cache=ResultCache(cache_bytes, cache_dir, cache_disk_bytes),
+                             job_store=JobStore(job_db) if job_db else None,
+                             admission=AdmissionController(parse_limits(admission_limits)), cpu_workers=cpu_workers,
+                             broker=broker)
+    resumed = httpd.jobs.restore()
+    if resumed:
+        print(f'Resumed {resumed} interrupted jobs')
+    print(f'Server is running with {workers} workers...')
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -221,4 +524,43 @@ def run():
         httpd.server_close()
         print('Server closed.')
 
-run()
\ No newline at end of file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HackerHelper API server')
+    parser.add_argument('--host', default='', help='Address to bind to')
+    parser.add_argument('--port', type=int, default=3001, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('HH_API_WORKERS', DEFAULT_WORKERS)),
+                        help='Maximum number of requests handled concurrently')
+    parser.add_argument('--job-workers', type=int, default=int(os.getenv('HH_API_JOB_WORKERS', DEFAULT_JOB_WORKERS)),
+                        help='Maximum number of background jobs run concurrently')
+    parser.add_argument('--preload', default=os.getenv('HH_API_PRELOAD', ''),
+                        help="Comma-separated modules to import at startup (e.g. core.network), or 'all'")
+    parser.add_argument('--cache-mb', type=int, default=int(os.getenv('HH_API_CACHE_MB', DEFAULT_MAX_BYTES // (1024 * 1024))),
+                        help='Memory budget of the result cache in megabytes')
+    parser.add_argument('--cache-dir', default=os.getenv('HH_API_CACHE_DIR'),
+                        help='Directory for the on-disk result cache (disabled when unset)')
+    parser.add_argument('--cache-disk-mb', type=int,
+                        default=int(os.getenv('HH_API_CACHE_DISK_MB', DEFAULT_DISK_MAX_BYTES // (1024 * 1024))),
+                        help='Disk budget of the on-disk result cache in megabytes')
+    parser.add_argument('--job-db', default=os.getenv('HH_API_JOB_DB'),
+                        help='SQLite file that keeps jobs across restarts (jobs are kept in memory when unset)')
+    parser.add_argument('--admission', default=os.getenv('HH_API_ADMISSION', ''),
+                        help='Per route class limits as class=limit:queue[:retry_after], e.g. heavy=2:8,light=64:256')
+    parser.add_argument('--cpu-workers', type=int, default=int(os.getenv('HH_API_CPU_WORKERS', DEFAULT_CPU_WORKERS)),
+                        help='Worker processes for CPU-bound routes such as key generation')
+    parser.add_argument('--broker', default=os.getenv('HH_API_BROKER'),
+                        help='Listen for scan workers (worker.py) on host:port and run scans on them instead of in-process')
+    parser.add_argument('--broker-secret', default=os.getenv('HH_API_BROKER_SECRET'),
+                        help='Shared secret workers must present to the broker; required unless it listens on loopback')
+    args = parser.parse_args(argv)
+    if args.broker and not args.broker_secret and not is_loopback(parse_address(args.broker)[0]):
+        parser.error('--broker-secret is required when the broker listens on a non-loopback address')
+    if args.preload == 'all':
+        preload_modules = route_modules()
+    else:
+        preload_modules = [name.strip() for name in args.preload.split(',') if name.strip()]
+    run(args.host, args.port, args.workers, args.job_workers, preload_modules, args.cache_mb * 1024 * 1024, args.cache_dir,
+        args.job_db, args.admission, args.cpu_workers, args.broker, args.broker_secret,
+        args.cache_disk_mb * 1024 * 1024)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
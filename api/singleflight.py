@@ -0,0 +1,165 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+from core import progress
+
+logger = logging.getLogger(__name__)
+
+class _Flight(progress.ProgressListener):
+    """One in-progress execution and the callers waiting on it."""
+
+    def __init__(self, resumed: Dict[str, Any]):
+        self.resumed = resumed
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.interested = 0
+        self.token = progress.CancelToken()
+        self._listeners = []
+        self._stages = []
+        self._wakers = []
+        self._lock = threading.Lock()
+
+    def attach(self, listener):
+        # Replay the stages finished so far, then forward new ones as they arrive.
+        with self._lock:
+            if all(self._notify(listener, stage) for stage in self._stages):
+                self._listeners.append(listener)
+
+    def detach(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def wait(self, token):
+        """Wait until the flight finishes or the caller's own token is cancelled."""
+        if token is None:
+            self.done.wait()
+            return
+        woken = threading.Event()
+        with self._lock:
+            self._wakers.append(woken)
+        if self.done.is_set():
+            return
+        unregister = token.on_cancel(woken.set)
+        woken.wait()
+        unregister()
+
+    def finish(self):
+        self.done.set()
+        with self._lock:
+            wakers = list(self._wakers)
+        for woken in wakers:
+            woken.set()
+
+    def resumed_stages(self):
+        return self.resumed
+
+    def on_stage(self, name, result, completed, total):
+        with self._lock:
+            self._stages.append((name, result, completed, total))
+            listeners = list(self._listeners)
+        for listener in listeners:
+            if not self._notify(listener, (name, result, completed, total)):
+                self.detach(listener)
+
+    @staticmethod
+    def _notify(listener, stage) -> bool:
+        try:
+            listener.on_stage(*stage)
+            return True
+        except Exception as e:
+            # One caller's listener failing (e.g. a closed stream) must not fail the execution the others share.
+            logger.error(f"Stage listener failed: {e}")
+            return False
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is running,
+    later callers with the same key wait for it and share its result.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        listener = progress.current_listener()
+        token = progress.current_token()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(listener.resumed_stages() if listener else {})
+                leader = True
+                self.executions += 1
+            else:
+                leader = False
+                flight.waiters += 1
+                self.coalesced += 1
+            flight.interested += 1
+
+        if listener is not None:
+            flight.attach(listener)
+        unregister = lambda: None
+        if token is not None:
+            unregister = token.on_cancel(lambda: self._withdraw(key, flight, listener))
+
+        if not leader:
+            try:
+                flight.wait(token)
+            finally:
+                unregister()
+                if listener is not None:
+                    flight.detach(listener)
+            progress.check_cancelled()
+            if isinstance(flight.error, progress.Cancelled):
+                # Only an abandoned execution is cancelled, and this caller never gave up on it; run it again.
+                return self.do(key, fn)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        # The execution runs under the flight's own token, so a cancelled leader
+        # keeps it going for as long as other callers still wait for it.
+        try:
+            with progress.listen(flight), progress.cancellable(flight.token):
+                flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            unregister()
+            if listener is not None:
+                flight.detach(listener)
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.finish()
+        progress.check_cancelled()
+        return flight.result
+
+    def _withdraw(self, key: str, flight: _Flight, listener):
+        # Cancel the shared execution once every caller waiting on it has been cancelled.
+        # It leaves the map first, so a caller arriving afterwards starts a new one.
+        if listener is not None:
+            flight.detach(listener)
+        with self._lock:
+            flight.interested -= 1
+            abandoned = flight.interested == 0
+            if abandoned and self._flights.get(key) is flight:
+                del self._flights[key]
+        if abandoned:
+            flight.token.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+                "waiting": sum(flight.waiters for flight in self._flights.values())
+            }
@@ -0,0 +1,47 @@
+import json
+import threading
+from typing import Any, Optional
+
+from core import progress
+
+NDJSON = "ndjson"
+SSE = "sse"
+
+CONTENT_TYPES = {
+    NDJSON: "application/x-ndjson",
+    SSE: "text/event-stream"
+}
+
+def negotiate_stream_format(accept: Optional[str], requested: Optional[str]) -> Optional[str]:
+    """Pick a streaming format from ?stream= or the Accept header, if the client asked for one."""
+    if requested:
+        requested = requested.lower()
+        if requested in CONTENT_TYPES:
+            return requested
+        if requested in ("1", "true", "yes"):
+            return NDJSON
+    accept = (accept or "").lower()
+    for fmt, content_type in CONTENT_TYPES.items():
+        if content_type in accept:
+            return fmt
+    return None
+
+class StreamWriter(progress.ProgressListener):
+    """Writes scan events to a response body as soon as they are reported."""
+
+    def __init__(self, wfile, fmt: str = NDJSON):
+        self.wfile = wfile
+        self.fmt = fmt
+        self._lock = threading.Lock()
+
+    def on_stage(self, name, result, completed, total):
+        self.send("stage", {"stage": name, "completed": completed, "total": total, "result": result})
+
+    def send(self, event: str, payload: Any):
+        if self.fmt == SSE:
+            data = f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+        else:
+            data = json.dumps({"event": event, **payload}, default=str) + "\n"
+        with self._lock:
+            self.wfile.write(data.encode())
+            self.wfile.flush()
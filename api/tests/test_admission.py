@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from admission import AdmissionController, Overloaded
+from core import progress
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+class AdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.admission = AdmissionController({"heavy": {"limit": 1, "queue": 1, "retry_after": 7}})
+        self.release = threading.Event()
+        self.threads = []
+
+    def tearDown(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def hold(self, wait=False, token=None):
+        admitted = threading.Event()
+
+        def run():
+            with progress.cancellable(token or progress.CancelToken()):
+                try:
+                    with self.admission.admit("heavy", wait=wait):
+                        admitted.set()
+                        self.release.wait(5)
+                except progress.Cancelled:
+                    pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return admitted
+
+    def stats(self):
+        return self.admission.stats()["heavy"]
+
+    def test_full_queue_is_rejected(self):
+        self.assertTrue(self.hold().wait(5))
+        self.hold()
+        wait_for(lambda: self.stats()["waiting"] == 1)
+        self.assertFalse(self.admission.has_capacity("heavy"))
+        with self.assertRaises(Overloaded) as raised:
+            with self.admission.admit("heavy"):
+                pass
+        self.assertEqual(raised.exception.retry_after, 7)
+        self.assertEqual(self.stats()["rejected"], 1)
+
+    def test_waiting_callers_never_overfill_the_queue(self):
+        self.hold().wait(5)
+        queued = self.hold()
+        wait_for(lambda: self.stats()["waiting"] == 1)
+        patient = self.hold(wait=True)
+        time.sleep(0.1)
+        self.assertEqual(self.stats()["waiting"], 1)
+        self.release.set()
+        self.assertTrue(queued.wait(5))
+        self.assertTrue(patient.wait(5))
+        for thread in self.threads:
+            thread.join(5)
+        self.assertEqual(self.stats(), {"limit": 1, "queue": 1, "active": 0, "waiting": 0, "rejected": 0})
+
+    def test_cancelled_caller_leaves_the_queue(self):
+        self.hold().wait(5)
+        token = progress.CancelToken()
+        self.hold(token=token)
+        wait_for(lambda: self.stats()["waiting"] == 1)
+        token.cancel()
+        wait_for(lambda: self.stats()["waiting"] == 0)
+        self.assertTrue(self.admission.has_capacity("heavy"))
+
+    def test_unknown_class_is_not_limited(self):
+        with self.admission.admit("unlisted"):
+            self.assertTrue(self.admission.has_capacity("unlisted"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from batch import MAX_CONCURRENCY, BatchError, batch_limits, expand_items, item_host
+from routes import ROUTES, route
+
+class ExpandItemsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        route('/tests/batch-check', 'json', lambda module, target: target, ['target'])
+
+    @classmethod
+    def tearDownClass(cls):
+        del ROUTES['/tests/batch-check']
+
+    def test_targets_and_checks(self):
+        items = expand_items({"targets": ["A.example", "b.example"], "checks": ["/tests/batch-check"],
+                              "params": {"timeout": 1}})
+        self.assertEqual([item["id"] for item in items],
+                         ["/tests/batch-check:A.example", "/tests/batch-check:b.example"])
+        self.assertEqual(items[0]["params"], {"timeout": 1, "target": "A.example"})
+        self.assertEqual(item_host(items[0]), "a.example")
+
+    def test_explicit_items(self):
+        items = expand_items({"items": [{"id": "x", "route": "/tests/batch-check", "params": {"target": "h"}},
+                                        {"route": "/tests/batch-check"}]})
+        self.assertEqual([(item["id"], item["params"]) for item in items], [("x", {"target": "h"}), ("1", {})])
+
+    def test_rejects_malformed_bodies(self):
+        bodies = [
+            {"targets": ["a"], "checks": ["/tests/batch-check"], "params": "x"},
+            {"targets": "abc", "checks": ["/tests/batch-check"]},
+            {"targets": ["a"], "checks": "/tests/batch-check"},
+            {"targets": ["a"], "checks": [["/tests/batch-check"]]},
+            {"items": "x"},
+            {"items": [{"route": "/tests/batch-check", "params": "x"}]},
+            {"items": [{"route": ["/tests/batch-check"]}]},
+            {"items": [{"id": "a", "route": "/tests/batch-check"}, {"id": "a", "route": "/tests/batch-check"}]},
+            {}
+        ]
+        for body in bodies:
+            with self.subTest(body=body), self.assertRaises(BatchError):
+                expand_items(body)
+
+class BatchLimitsTest(unittest.TestCase):
+    def test_concurrency_is_capped(self):
+        self.assertEqual(batch_limits({"concurrency": 10 ** 6, "per_host": 3}), (MAX_CONCURRENCY, 3))
+
+    def test_rejects_invalid_limits(self):
+        for body in ({"concurrency": "many"}, {"per_host": 0}):
+            with self.subTest(body=body), self.assertRaises(BatchError):
+                batch_limits(body)
+
+if __name__ == '__main__':
+    unittest.main()
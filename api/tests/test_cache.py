@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import cache
+from cache import DiskBackend, ResultCache
+
+ENTRY = "x" * 200
+
+class DiskBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def files(self):
+        return {name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")}
+
+    def test_least_recently_used_entries_are_evicted(self):
+        disk = DiskBackend(self.directory, max_bytes=2000)
+        for i in range(8):
+            disk.set(f"k{i}", ENTRY, 2 ** 40)
+        self.assertIsNot(disk.get("k0"), cache._MISSING)
+        for i in range(8, 12):
+            disk.set(f"k{i}", ENTRY, 2 ** 40)
+        stats = disk.stats()
+        self.assertLessEqual(stats["bytes"], 2000)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertIn("k0", self.files())
+        self.assertNotIn("k1", self.files())
+        self.assertEqual(self.files(), set(disk._index))
+
+    def test_expired_entries_are_swept(self):
+        disk = DiskBackend(self.directory, max_bytes=10000)
+        disk.set("stale", ENTRY, 0)
+        disk._next_sweep = 0
+        disk.set("fresh", ENTRY, 2 ** 40)
+        self.assertEqual(self.files(), {"fresh"})
+        self.assertIs(disk.get("stale"), cache._MISSING)
+
+    def test_files_from_an_earlier_run_count_against_the_budget(self):
+        disk = DiskBackend(self.directory, max_bytes=10000)
+        for i in range(6):
+            disk.set(f"k{i}", ENTRY, 2 ** 40)
+        with open(os.path.join(self.directory, "k9.abc.json.tmp"), "w") as f:
+            f.write("partial")
+        reopened = DiskBackend(self.directory, max_bytes=1000)
+        self.assertLessEqual(reopened.stats()["bytes"], 1000)
+        self.assertEqual(set(os.listdir(self.directory)), {f"{key}.json" for key in reopened._index})
+        self.assertEqual(reopened.get("k5")[0], ENTRY)
+
+    def test_concurrent_writes_keep_index_and_files_in_step(self):
+        disk = DiskBackend(self.directory, max_bytes=3000)
+
+        def write(offset):
+            for i in range(200):
+                disk.set(f"k{(i + offset) % 30}", ENTRY, 2 ** 40 if i % 5 else 0)
+                disk.get(f"k{i % 30}")
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.files(), set(disk._index))
+        self.assertEqual(sum(size for size, _ in disk._index.values()), disk.stats()["bytes"])
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith(".tmp")])
+
+    def test_result_cache_reads_through_to_disk(self):
+        ResultCache(directory=self.directory).set("key", {"open": [22]}, 60)
+        self.assertEqual(ResultCache(directory=self.directory).get("key"), {"open": [22]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from core import progress
+from jobs import JOB_COMPLETED, JOB_RUNNING, Job, JobManager
+from jobstore import JobStore
+
+class JobResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = JobStore(os.path.join(self.directory, "jobs.db"))
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.shutdown()
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def manager(self, runner, **kwargs):
+        manager = JobManager(runner, store=self.store, **kwargs)
+        self.managers.append(manager)
+        return manager
+
+    def interrupted_job(self) -> Job:
+        job = Job("/tests/scan", {"target": "a"}, self.store)
+        job.status = JOB_RUNNING
+        job.save()
+        return job
+
+    def test_only_successful_stages_are_saved(self):
+        job = self.interrupted_job()
+        job.on_stage("ports", {"open": [22]}, 1, 3)
+        job.on_stage("services", {"error": "nmap failed"}, 2, 3)
+        job.token.cancel()
+        job.on_stage("os", {"name": "linux"}, 3, 3)
+        self.assertEqual(self.store.load_stages(job.id), {"ports": {"open": [22]}})
+
+    def test_interrupted_job_resumes_with_finished_stages(self):
+        job = self.interrupted_job()
+        job.on_stage("ports", {"open": [22]}, 1, 2)
+        # Written before failed stages stopped being saved.
+        self.store.save_stage(job.id, "services", {"error": "killed"})
+
+        seen = []
+
+        def runner(route, params):
+            seen.append(dict(progress.resumed_stages()))
+            return {"done": True}
+
+        manager = self.manager(runner)
+        self.assertEqual(manager.restore(), 1)
+        resumed = manager.get(job.id)
+        resumed.future.result(5)
+        self.assertEqual(seen, [{"ports": {"open": [22]}}])
+        self.assertEqual(resumed.status, JOB_COMPLETED)
+        self.assertEqual(self.store.load_job(job.id)["result"], {"done": True})
+        self.assertEqual(self.store.load_stages(job.id), {})
+
+    def test_finished_jobs_are_pruned(self):
+        for i in range(5):
+            job = Job("/tests/scan", {}, self.store)
+            job.status = JOB_COMPLETED
+            job.created = time.time() + i
+            job.save()
+        manager = self.manager(lambda route, params: None, max_finished=2)
+        manager.restore()
+        self.assertEqual(len(self.store.load_jobs()), 2)
+
+        for _ in range(3):
+            manager.submit("/tests/scan", {}).future.result(5)
+        manager.submit("/tests/scan", {}).future.result(5)
+        self.assertLessEqual(len(self.store.load_jobs()), 3)
+        self.assertEqual({record["id"] for record in self.store.load_jobs()},
+                         {job.id for job in manager.list()})
+
+if __name__ == '__main__':
+    unittest.main()
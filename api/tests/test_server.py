@@ -0,0 +1,58 @@
+import http.client
+import json
+import threading
+import unittest
+
+from routes import ROUTES, route
+from server import MyServer, PooledHTTPServer
+
+class ServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        route('/tests/list', 'json', lambda module: [1, 2])
+        route('/tests/bad-trace', 'json', lambda module: {"_trace": "not a summary"})
+        cls.httpd = PooledHTTPServer(('127.0.0.1', 0), MyServer, max_workers=4)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        del ROUTES['/tests/list']
+        del ROUTES['/tests/bad-trace']
+
+    def post(self, path, body):
+        connection = http.client.HTTPConnection(*self.httpd.server_address, timeout=10)
+        try:
+            connection.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_body_must_be_an_object(self):
+        for path in ('/jobs', '/batch', '/tests/list'):
+            with self.subTest(path=path):
+                status, body = self.post(path, '[1, 2]')
+                self.assertEqual(status, 400)
+                self.assertIn("error", body)
+
+    def test_malformed_batch_is_rejected(self):
+        for body in ({"targets": ["a"], "checks": ["/tests/list"], "params": "x"},
+                     {"targets": "abc", "checks": ["/tests/list"]}):
+            with self.subTest(body=body):
+                status, _ = self.post('/batch', json.dumps(body))
+                self.assertEqual(status, 400)
+
+    def test_chrome_trace_of_a_list_result(self):
+        status, body = self.post('/tests/list?trace=chrome', '{}')
+        self.assertEqual(status, 200)
+        self.assertEqual([event["name"] for event in body["traceEvents"]], ['/tests/list'])
+
+    def test_result_without_a_usable_trace(self):
+        status, body = self.post('/tests/bad-trace?trace=chrome', '{}')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"_trace": "not a summary"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+
+from core import progress
+from singleflight import SingleFlight
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+class Caller(threading.Thread):
+    """Calls flights.do() under its own cancel token and records the outcome."""
+
+    def __init__(self, flights, key, fn, listener=None):
+        super().__init__(daemon=True)
+        self.flights = flights
+        self.key = key
+        self.fn = fn
+        self.listener = listener
+        self.token = progress.CancelToken()
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            with progress.cancellable(self.token):
+                if self.listener is not None:
+                    with progress.listen(self.listener):
+                        self.result = self.flights.do(self.key, self.fn)
+                else:
+                    self.result = self.flights.do(self.key, self.fn)
+        except BaseException as e:
+            self.error = e
+
+class Stages(progress.ProgressListener):
+    def __init__(self, fail=False):
+        self.names = []
+        self.fail = fail
+
+    def on_stage(self, name, result, completed, total):
+        if self.fail:
+            raise OSError("stream closed")
+        self.names.append(name)
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def blocking(self):
+        self.runs += 1
+        progress.report_stage("first")
+        progress.on_cancel(self.release.set)
+        self.release.wait(5)
+        progress.check_cancelled()
+        return self.runs
+
+    def start(self, listener=None):
+        caller = Caller(self.flights, "key", self.blocking, listener)
+        caller.start()
+        return caller
+
+    def test_identical_calls_share_one_execution(self):
+        leader = self.start()
+        wait_for(lambda: self.runs == 1)
+        waiter = self.start()
+        wait_for(lambda: self.flights.stats()["waiting"] == 1)
+        self.release.set()
+        leader.join(5)
+        waiter.join(5)
+        self.assertEqual((leader.result, waiter.result), (1, 1))
+        self.assertEqual(self.flights.stats()["executions"], 1)
+
+    def test_cancelled_leader_leaves_execution_to_waiter(self):
+        leader = self.start()
+        wait_for(lambda: self.runs == 1)
+        waiter = self.start()
+        wait_for(lambda: self.flights.stats()["waiting"] == 1)
+        leader.token.cancel()
+        self.release.set()
+        leader.join(5)
+        waiter.join(5)
+        self.assertIsInstance(leader.error, progress.Cancelled)
+        self.assertEqual(waiter.result, 1)
+        self.assertEqual(self.runs, 1)
+
+    def test_abandoned_execution_is_cancelled_and_run_again(self):
+        first = self.start()
+        wait_for(lambda: self.runs == 1)
+        first.token.cancel()
+        first.join(5)
+        self.assertIsInstance(first.error, progress.Cancelled)
+        self.assertEqual(self.flights.stats()["in_flight"], 0)
+
+        self.release.clear()
+        second = self.start()
+        wait_for(lambda: self.runs == 2)
+        self.release.set()
+        second.join(5)
+        self.assertEqual(second.result, 2)
+        self.assertEqual(self.flights.stats()["executions"], 2)
+
+    def test_failing_listener_does_not_fail_the_shared_result(self):
+        leader = self.start(Stages())
+        wait_for(lambda: self.runs == 1)
+        broken = self.start(Stages(fail=True))
+        healthy = Stages()
+        waiter = self.start(healthy)
+        wait_for(lambda: self.flights.stats()["waiting"] == 2)
+        self.release.set()
+        for caller in (leader, broken, waiter):
+            caller.join(5)
+        self.assertEqual((leader.result, broken.result, waiter.result), (1, 1, 1))
+        self.assertEqual(healthy.names, ["first"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import zlib
+from typing import Any, Iterator, Optional
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves.
+MIN_COMPRESS_SIZE = 1024
+# Bodies larger than this are sent with chunked transfer encoding.
+CHUNK_THRESHOLD = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the client's preferred supported content coding from an Accept-Encoding header."""
+    best, best_q = None, 0.0
+    for part in (accept_encoding or "").split(","):
+        fields = part.strip().split(";")
+        coding = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in SUPPORTED_ENCODINGS and q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compressor(encoding: str):
+    wbits = 31 if encoding == "gzip" else 15
+    return zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    c = compressor(encoding)
+    return c.compress(body) + c.flush()
+
+def iter_json(value: Any) -> Iterator[str]:
+    """
+    Encode a value as JSON piece by piece, like json.dumps(value, default=str).
+    Iterators (such as generators of scan records) are encoded as arrays while
+    they are consumed, so they never have to be held in memory as a whole.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        for index, (key, item) in enumerate(value.items()):
+            yield (", " if index else "") + json.dumps(key if isinstance(key, str) else str(key)) + ": "
+            yield from iter_json(item)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        for index, item in enumerate(value):
+            if index:
+                yield ", "
+            yield from iter_json(item)
+        yield "]"
+    elif isinstance(value, Iterator):
+        yield "["
+        for index, item in enumerate(value):
+            # Records yielded by an iterator are plain data; encode each in one call.
+            piece = "".join(iter_json(item)) if isinstance(item, Iterator) else json.dumps(item, default=str)
+            yield (", " + piece) if index else piece
+        yield "]"
+    else:
+        yield json.dumps(value, default=str)
+
+def json_chunks(value: Any, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode a value with iter_json and yield the output in chunks of roughly `size` bytes."""
+    buffer, buffered = [], 0
+    for piece in iter_json(value):
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield "".join(buffer).encode()
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+class ResponseBody:
+    """
+    File-like response body that optionally compresses and chunk-encodes what is written to it.
+
+    flush() pushes everything written so far to the client, which is what
+    streaming responses rely on; close() terminates the body.
+    """
+
+    def __init__(self, wfile, encoding: Optional[str] = None, chunked: bool = True):
+        self.wfile = wfile
+        self.chunked = chunked
+        self._compressor = compressor(encoding) if encoding else None
+        self.bytes_written = 0
+
+    def write(self, data: bytes):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._write_raw(data)
+
+    def flush(self):
+        if self._compressor is not None:
+            self._write_raw(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.wfile.flush()
+
+    def close(self):
+        if self._compressor is not None:
+            self._write_raw(self._compressor.flush())
+            self._compressor = None
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_raw(self, data: bytes):
+        if not data:
+            return
+        self.bytes_written += len(data)
+        if self.chunked:
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        else:
+            self.wfile.write(data)
+
+class CountingWriter:
+    """Wraps a connection's write file and counts the bytes sent through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def write(self, data: bytes):
+        self.count += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
@@ -0,0 +1,149 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from broker import HEARTBEAT_INTERVAL, drop, parse_address, send_message, sign_challenge
+from core import progress, tracing
+from routes import RouteNotFound, dispatch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 4
+RECONNECT_DELAY = 5
+
+class _RemoteListener(progress.ProgressListener):
+    """Forwards the stages of a task to the broker."""
+
+    def __init__(self, connection: "WorkerConnection", task_id: str, resumed: Dict[str, Any]):
+        self.connection = connection
+        self.task_id = task_id
+        self.resumed = resumed
+
+    def on_stage(self, name, result, completed, total):
+        self.connection.send({"type": "stage", "id": self.task_id, "name": name, "result": result,
+                              "completed": completed, "total": total})
+
+    def resumed_stages(self):
+        return self.resumed
+
+class WorkerConnection:
+    """One connection to the broker, running the tasks it assigns on a thread pool."""
+
+    def __init__(self, sock: socket.socket, slots: int):
+        self.sock = sock
+        self.slots = slots
+        self._write_lock = threading.Lock()
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def send(self, message: Dict[str, Any]):
+        send_message(self.sock, self._write_lock, message)
+
+    def serve(self, name: str, secret: str = None):
+        reader = self.sock.makefile("rb")
+        challenge = json.loads(reader.readline() or b"null")
+        if not isinstance(challenge, dict) or challenge.get("type") != "challenge":
+            raise ValueError("Broker did not send a challenge")
+        self.send({"type": "hello", "name": name, "slots": self.slots,
+                   "proof": sign_challenge(secret, str(challenge.get("nonce", "")))})
+        threading.Thread(target=self._heartbeat, name="worker-heartbeat", daemon=True).start()
+        with ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="task") as executor:
+            try:
+                for line in reader:
+                    message = json.loads(line)
+                    if message.get("type") == "run":
+                        token = progress.CancelToken()
+                        with self._lock:
+                            self._tokens[message["id"]] = token
+                        executor.submit(self._run, message, token)
+                    elif message.get("type") == "cancel":
+                        with self._lock:
+                            token = self._tokens.get(message["id"])
+                        if token is not None:
+                            token.cancel()
+            finally:
+                # Tasks are re-queued by the broker once it sees the connection go, so stop them here.
+                self._closed.set()
+                with self._lock:
+                    tokens = list(self._tokens.values())
+                for token in tokens:
+                    token.cancel()
+
+    def _run(self, message: Dict[str, Any], token: progress.CancelToken):
+        task_id = message["id"]
+        listener = _RemoteListener(self, task_id, message.get("resumed") or {})
+        try:
+            params = message.get("params") or {}
+            with progress.listen(listener), progress.cancellable(token):
+                if params.get("_trace"):
+                    with tracing.trace() as recording, tracing.span(message["route"], "request"):
+                        result = dispatch(message["route"], params)
+                    result = tracing.attach(result, recording)
+                else:
+                    result = dispatch(message["route"], params)
+            if token.cancelled:
+                reply = {"type": "cancelled", "id": task_id}
+            else:
+                reply = {"type": "done", "id": task_id, "result": result}
+        except progress.Cancelled:
+            reply = {"type": "cancelled", "id": task_id}
+        except RouteNotFound:
+            reply = {"type": "failed", "id": task_id, "error": f"Unknown route: {message['route']}"}
+        except Exception as e:
+            logger.error(f"Task {task_id} ({message['route']}) failed: {e}")
+            reply = {"type": "failed", "id": task_id, "error": str(e)}
+        finally:
+            with self._lock:
+                self._tokens.pop(task_id, None)
+        try:
+            self.send(reply)
+        except OSError:
+            pass
+
+    def _heartbeat(self):
+        while not self._closed.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.send({"type": "ping"})
+            except OSError:
+                drop(self.sock)
+                return
+
+def run(broker: str, slots: int = DEFAULT_SLOTS, name: str = None, secret: str = None):
+    """Serve tasks from the broker forever, reconnecting whenever the connection is lost."""
+    address = parse_address(broker)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            sock = socket.create_connection(address)
+        except OSError as e:
+            logger.warning(f"Cannot reach broker at {address[0]}:{address[1]}: {e}")
+            time.sleep(RECONNECT_DELAY)
+            continue
+        logger.info(f"Connected to broker at {address[0]}:{address[1]} as {name} with {slots} slots")
+        try:
+            WorkerConnection(sock, slots).serve(name, secret)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Connection to broker lost: {e}")
+        finally:
+            drop(sock)
+        time.sleep(RECONNECT_DELAY)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='HackerHelper scan worker')
+    parser.add_argument('--broker', default=os.getenv('HH_API_BROKER', '127.0.0.1:3002'),
+                        help='Address of the broker started by server.py --broker, as host:port')
+    parser.add_argument('--slots', type=int, default=int(os.getenv('HH_WORKER_SLOTS', DEFAULT_SLOTS)),
+                        help='Number of tasks run at once')
+    parser.add_argument('--name', default=os.getenv('HH_WORKER_NAME'), help='Name reported to the broker')
+    parser.add_argument('--secret', default=os.getenv('HH_API_BROKER_SECRET'),
+                        help='Shared secret expected by the broker')
+    args = parser.parse_args()
+    run(args.broker, args.slots, args.name, args.secret)
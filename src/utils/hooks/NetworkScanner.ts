@@ -40,18 +40,44 @@ export class NetworkScanner {
   }
 
   async scan(target: string): Promise<ScanResult> {
-    const scanResults: { [key: string]: ScanResult } = {};
+    const scanTypes = ['http-enum', 'ssl-enum', 'dns-brute', 'smb-enum', 'mysql-enum', 'nmap-scan'];
 
-    for (const scanType of ['http-enum', 'ssl-enum', 'dns-brute', 'smb-enum', 'mysql-enum', 'nmap-scan']) {
-      scanResults[scanType] = await this[scanType](target); 
-    }
+    try {
+      const response = await fetch('http://localhost:3001/batch', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          items: scanTypes.map((scanType) => ({
+            id: scanType,
+            route: `/network/${scanType}`,
+            params: scanType === 'dns-brute' ? { domain: target } : { target },
+          })),
+        })
+      });
 
+      const data = await response.json();
+      const scanResults: { [key: string]: any } = {};
 
-    return {
-      status: 'success',
-      message: 'Network scan completed',
-      details: scanResults,
-    };
+      for (const scanType of scanTypes) {
+        const item = data.results[scanType];
+        scanResults[scanType] = item.status === 'ok'
+          ? item.result
+          : { status: 'error', message: `${scanType} for ${target} failed: ${item.error}` };
+      }
+
+      return {
+        status: 'success',
+        message: 'Network scan completed',
+        details: scanResults,
+      };
+    } catch (error) {
+      return {
+        status: 'error',
+        message: `Network scan for ${target} failed: ${error instanceof Error ? error.message : 'Unknown error'}`
+      };
+    }
   }
 
   async httpEnum(target: string): Promise<any> {
@@ -1,46 +1,60 @@
 import { ScanResult } from '../securityScanner';
 
 export class VulnerabilityScanner {
-  runSelectedScans(target: string, selectedScans: string[]): Promise<ScanResult> {
+  async runSelectedScans(target: string, selectedScans: string[]): Promise<ScanResult> {
     const scanResults: { [key: string]: ScanResult } = {};
+    const endpoints: { [key: string]: string } = {
+      'xss': '/vulnerability/xss',
+      'csrf': '/vulnerability/csrf',
+      'clickjacking': '/vulnerability/clickjacking',
+      'sql-injection': '/vulnerability/sql-injection',
+      'ssl-tls': '/vulnerability/ssl-tls',
+      'fully-vuln-scan': '/vulnerability/fully-vuln-scan',
+    };
 
-    selectedScans.forEach(async (scan) => {
-      switch (scan) {
-        case 'xss':
-          scanResults[scan] = await this.checkXSS(target);
-          break;
-        case 'csrf':
-          scanResults[scan] = await this.checkCSRF(target);
-          break;
-        case 'clickjacking':
-          scanResults[scan] = await this.checkClickjacking(target);
-          break;
-        case 'sql-injection':
-          scanResults[scan] = await this.checkSQLInjection(target);
-          break;
-        case 'ssl-tls':
-          scanResults[scan] = await this.checkSSLTLS(target);
-          break;
-        case 'fully-vuln-scan':
-          scanResults[scan] = await this.performFullVulnerabilityScan(target);
-          break;
-        default:
+    for (const scan of selectedScans.filter((scan) => !(scan in endpoints))) {
+      scanResults[scan] = {
+        status: 'error',
+        message: `Unknown scan type: ${scan}`,
+      };
+    }
+
+    const scans = selectedScans.filter((scan) => scan in endpoints);
+    if (scans.length > 0) {
+      try {
+        const response = await fetch('http://localhost:3001/batch', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            items: scans.map((scan) => ({ id: scan, route: endpoints[scan], params: { url: target } })),
+          })
+        });
+
+        const data = await response.json();
+
+        for (const scan of scans) {
+          const item = data.results[scan];
+          scanResults[scan] = item.status === 'ok'
+            ? { status: 'success', message: `Vulnerability check for ${endpoints[scan]} completed`, details: item.result }
+            : { status: 'error', message: `Vulnerability check for ${endpoints[scan]} failed: ${item.error}` };
+        }
+      } catch (error) {
+        for (const scan of scans) {
           scanResults[scan] = {
             status: 'error',
-            message: `Unknown scan type: ${scan}`,
+            message: `Vulnerability check for ${endpoints[scan]} failed: ${error instanceof Error ? error.message : 'Unknown error'}`
           };
+        }
       }
-    });
+    }
 
-    return new Promise((resolve) => {
-      setTimeout(() => {
-        resolve({
-          status: 'success',
-          message: 'Vulnerability scans completed',
-          details: scanResults,
-        });
-      }, 1000);
-    });
+    return {
+      status: 'success',
+      message: 'Vulnerability scans completed',
+      details: scanResults,
+    };
   }
 
   async checkXSS(target: string): Promise<ScanResult> {